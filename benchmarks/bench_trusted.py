@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import argparse
+import timeit
+
+from instaproapi.schemas.action import OutAction
+from instaproapi.schemas.user import OutUser
+from instaproapi.trusted import construct_trusted
+
+
+def user_payload(subscribes: int) -> dict:
+    return {'telegram_id': 1, 'id': 'user', 'accounts_ids': [f'account_{i}' for i in range(subscribes)],
+            'subscribes': [{'action_type': 'WATCH_STORIES', 'account_id': f'account_{i}',
+                            'subscribe_date': '2026-01-01T00:00:00'} for i in range(subscribes)]}
+
+
+def action_payload() -> dict:
+    return {'id': 'action', 'action_type': 'WATCH_STORIES', 'status': 'WAITING', 'account_id': 'account',
+            'update_id': '1', 'data': {'key': 'value'}, 'result': None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validated vs trusted construction of Out* schemas')
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--subscribes', type=int, default=50)
+    args = parser.parse_args()
+
+    cases = {'OutAction': (OutAction, action_payload()),
+             f'OutUser ({args.subscribes} subscribes)': (OutUser, user_payload(args.subscribes))}
+    for title, (model, payload) in cases.items():
+        assert construct_trusted(model, payload).dict() == model(**payload).dict()
+        validated = timeit.timeit(lambda: model(**payload), number=args.number) / args.number
+        trusted = timeit.timeit(lambda: construct_trusted(model, payload), number=args.number) / args.number
+        print(f'{title}: validated {validated * 1e6:.1f} us, trusted {trusted * 1e6:.1f} us, '
+              f'x{validated / trusted:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List
+
+from instaproapi.fake_api import FakeAPI
+from instaproapi.insta_pro_api import InstaproAPI
+from instaproapi.schemas.fake import InstanceTypes
+from instaproapi.schemas.server_types import ActionStatuses
+
+from .stub_server import add_config_arguments, config_from_arguments, run_forever
+
+Call = Callable[[int], Awaitable[object]]
+
+
+def scenarios(api: InstaproAPI, fake_api: FakeAPI) -> Dict[str, Call]:
+    async def iter_all(i: int):
+        return [user async for user in api.iter_all()]
+
+    async def analyze_crawl(i: int):
+        last_max_id = None
+        while True:
+            page = await fake_api.analyze(f'instance_{i}', last_max_id)
+            last_max_id = page.get('last_max_id')
+            if not last_max_id:
+                return page
+
+    return {
+        'get_user': lambda i: api.get_user(f'user_{i}'),
+        'get_user_by_telegram_id': lambda i: api.get_user_by_telegram_id(i),
+        'get_account': lambda i: api.get_account(f'account_{i}'),
+        'get_accounts[20]': lambda i: api.get_accounts([f'account_{i}_{j}' for j in range(20)]),
+        'get_action_queue': lambda i: api.get_action_queue(f'sub_server_{i}'),
+        'set_status': lambda i: api.set_status(f'action_{i}', ActionStatuses.completed),
+        'set_data': lambda i: api.set_data(f'action_{i}', 'progress', str(i)),
+        'get_all': lambda i: api.get_all(),
+        'iter_all': iter_all,
+        'get_analyze': lambda i: api.get_analyze(f'analyze_{i}'),
+        'fake.analyze_crawl': analyze_crawl,
+        'fake.like': lambda i: fake_api.like(f'account_{i}', 'instance', InstanceTypes.user),
+    }
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_scenario(call: Call, requests: int, concurrency: int, trace_memory: bool) -> Dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await call(i)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'throughput': requests / elapsed, 'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99),
+            'errors': errors, 'peak_mb': peak / 1024 ** 2}
+
+
+def wait_for_port(host: str, port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f'Stub server on {host}:{port} did not start')
+
+
+async def run(args: argparse.Namespace):
+    api = InstaproAPI(args.host, args.port, trusted=args.trusted, coalesce_reads=not args.no_coalesce)
+    fake_api = FakeAPI(args.host, args.port, coalesce_reads=not args.no_coalesce)
+    await api.start()
+    await fake_api.start()
+    try:
+        available = scenarios(api, fake_api)
+        selected = args.scenario or list(available)
+        print(f'{"scenario":<26}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}'
+              + (f'{"peak MB":>10}' if args.memory else ''))
+        for name in selected:
+            requests = args.requests if not name.startswith(('get_all', 'iter_all', 'get_analyze')) \
+                else max(1, args.requests // 20)
+            result = await run_scenario(available[name], requests, args.concurrency, args.memory)
+            print(f'{name:<26}{result["throughput"]:>10.0f}{result["p50"] * 1000:>10.2f}'
+                  f'{result["p99"] * 1000:>10.2f}{result["errors"]:>8}'
+                  + (f'{result["peak_mb"]:>10.1f}' if args.memory else ''))
+    finally:
+        await api.stop()
+        await fake_api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='InstaproAPI / FakeAPI benchmarks against a local stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18081)
+    parser.add_argument('--external', action='store_true', help='use an already running stub server')
+    parser.add_argument('--scenario', action='append', help='run only these scenarios (repeatable)')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--memory', action='store_true', help='report tracemalloc peak per scenario (slower)')
+    parser.add_argument('--trusted', action='store_true', help='build models in trusted mode')
+    parser.add_argument('--no-coalesce', action='store_true', help='disable single-flight coalescing')
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    if not args.external:
+        # Заглушка в отдельном процессе, чтобы не делить с клиентом event loop и GIL
+        server = multiprocessing.Process(target=run_forever, args=(config_from_arguments(args), args.host, args.port),
+                                         daemon=True)
+        server.start()
+    try:
+        wait_for_port(args.host, args.port)
+        asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+
+if __name__ == '__main__':
+    main()
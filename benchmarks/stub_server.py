@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, users: int = 100,
+                 subscribes: int = 10, followers: int = 1000, analyze_pages: int = 5, page_size: int = 200):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.users = users
+        self.subscribes = subscribes
+        self.followers = followers
+        self.analyze_pages = analyze_pages
+        self.page_size = page_size
+
+
+def user_payload(index: int, subscribes: int) -> dict:
+    return {'telegram_id': index, 'id': f'user_{index}',
+            'accounts_ids': [f'account_{i}' for i in range(subscribes)],
+            'subscribes': [{'action_type': 'WATCH_STORIES', 'account_id': f'account_{i}',
+                            'subscribe_date': '2026-01-01T00:00:00'} for i in range(subscribes)],
+            'fakes': [], 'analyzes': [f'analyze_{index}']}
+
+
+def account_payload(instance_id: str) -> dict:
+    return {'login': f'login_{instance_id}', 'password': 'secret', 'sub_server_id': 'sub_server_0',
+            'actions_ids': ['action_0'], 'user_id': 'user_0', 'id': instance_id}
+
+
+def action_payload(instance_id: str) -> dict:
+    return {'id': instance_id, 'action_type': 'WATCH_STORIES', 'status': 'WAITING', 'account_id': 'account_0',
+            'update_id': '1', 'data': {'progress': '0'}, 'result': None}
+
+
+def analyze_payload(instance_id: str, followers: int) -> dict:
+    return {'id': instance_id, 'username': 'username', 'user_id': 'user_0', 'is_subscribe': True,
+            'data': {'followers': [f'follower_{i}' for i in range(followers)],
+                     'following': [f'following_{i}' for i in range(followers // 10)]}}
+
+
+def sub_server_payload(index: int) -> dict:
+    return {'id': f'sub_server_{index}', 'host': '127.0.0.1', 'port': 9000 + index, 'accounts_ids': []}
+
+
+def fake_payload(instance_id: str) -> dict:
+    return {'username': 'fake', 'description': None, 'subscribe_date': None, 'data': {}, 'status': 'WAITING',
+            'id': instance_id}
+
+
+class StubServer:
+    """
+    Заглушка бэкенда Instapro и сабсервера FakeAPI для бенчмарков
+    """
+
+    def __init__(self, config: StubConfig):
+        self._config = config
+        self._data: dict[tuple[str, str], str] = {}
+        # Крупные ответы сериализуются один раз, чтобы заглушка не была узким местом
+        self._users = json.dumps([user_payload(i, config.subscribes) for i in range(config.users)]).encode()
+        self._analyze = json.dumps(analyze_payload('analyze_0', config.followers)).encode()
+        self._user = json.dumps(user_payload(0, config.subscribes)).encode()
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3)
+        routes = {
+            '/api/users/get': self.get_user,
+            '/api/users/get_by_telegram_id': self.get_user,
+            '/api/users/create': self.get_user,
+            '/api/users/get_all': self.get_all,
+            '/api/users/subscribe': self.ok,
+            '/api/users/delete': self.ok,
+            '/api/accounts/get': self.get_account,
+            '/api/accounts/create': self.get_account,
+            '/api/accounts/update': self.ok,
+            '/api/accounts/delete': self.ok,
+            '/api/actions/get': self.get_action,
+            '/api/actions/get_queue': self.get_action,
+            '/api/actions/create': self.get_action,
+            '/api/actions/get_all_by_account': self.get_actions,
+            '/api/actions/set_status': self.ok,
+            '/api/actions/set_data': self.set_value,
+            '/api/actions/set_result': self.set_value,
+            '/api/actions/get_data': self.get_value,
+            '/api/actions/get_result': self.get_value,
+            '/api/analyze/get': self.get_analyze,
+            '/api/analyze/create': self.get_analyze,
+            '/api/analyze/update': self.ok,
+            '/api/fakes/get': self.get_fake,
+            '/api/sub_servers/get': self.get_sub_servers,
+            '/api/sub_servers/get_queue': self.get_sub_server,
+            '/api/sub_servers/create': self.get_sub_server,
+            '/api/analyze/analyze': self.fake_analyze,
+            '/api/analyze/unfollow': self.ok,
+            '/api/story_like/like': self.ok,
+        }
+        for path, handler in routes.items():
+            app.router.add_post(path, self._wrap(handler))
+        return app
+
+    def _wrap(self, handler):
+        async def wrapper(request: web.Request) -> web.StreamResponse:
+            self.requests += 1
+            config = self._config
+            if config.latency or config.jitter:
+                await asyncio.sleep(config.latency + random.uniform(0, config.jitter))
+            if config.error_rate and random.random() < config.error_rate:
+                return web.Response(status=503)
+            return await handler(request)
+
+        return wrapper
+
+    @staticmethod
+    def _json(body: bytes) -> web.Response:
+        return web.Response(body=body, content_type='application/json')
+
+    @staticmethod
+    async def _instance_id(request: web.Request) -> str:
+        if request.can_read_body:
+            body = await request.json()
+            if isinstance(body, dict):
+                return str(body.get('instance_id', 'instance_0'))
+        return 'instance_0'
+
+    async def ok(self, request: web.Request) -> web.Response:
+        return web.json_response({'ok': True})
+
+    async def get_user(self, request: web.Request) -> web.Response:
+        return self._json(self._user)
+
+    async def get_all(self, request: web.Request) -> web.Response:
+        return self._json(self._users)
+
+    async def get_account(self, request: web.Request) -> web.Response:
+        return web.json_response(account_payload(await self._instance_id(request)))
+
+    async def get_action(self, request: web.Request) -> web.Response:
+        return web.json_response(action_payload(await self._instance_id(request)))
+
+    async def get_actions(self, request: web.Request) -> web.Response:
+        return web.json_response([action_payload(f'action_{i}') for i in range(self._config.subscribes)])
+
+    async def get_analyze(self, request: web.Request) -> web.Response:
+        return self._json(self._analyze)
+
+    async def get_fake(self, request: web.Request) -> web.Response:
+        return web.json_response(fake_payload(await self._instance_id(request)))
+
+    async def get_sub_servers(self, request: web.Request) -> web.Response:
+        return web.json_response([sub_server_payload(i) for i in range(4)])
+
+    async def get_sub_server(self, request: web.Request) -> web.Response:
+        return web.json_response(sub_server_payload(0))
+
+    async def set_value(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self._data[(body['instance_id'], body['key'])] = body['value']
+        return web.json_response({'ok': True})
+
+    async def get_value(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        return web.json_response(self._data.get((body['instance_id'], body['key'])))
+
+    async def fake_analyze(self, request: web.Request) -> web.Response:
+        page = int(request.query.get('last_max_id') or 0)
+        size = self._config.page_size
+        next_page = page + 1 if page + 1 < self._config.analyze_pages else None
+        return web.json_response({'users': [f'user_{page}_{i}' for i in range(size)],
+                                  'last_max_id': str(next_page) if next_page is not None else None})
+
+
+async def serve(config: StubConfig, host: str = '127.0.0.1', port: int = 8081) -> web.AppRunner:
+    runner = web.AppRunner(StubServer(config).app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def run_forever(config: StubConfig, host: str, port: int):
+    async def main():
+        await serve(config, host, port)
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', type=float, default=0.0, help='server-side delay per request, seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random delay up to this value, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--users', type=int, default=100, help='users returned by get_all')
+    parser.add_argument('--subscribes', type=int, default=10, help='subscribes per user')
+    parser.add_argument('--followers', type=int, default=1000, help='followers in an analyze payload')
+    parser.add_argument('--analyze-pages', type=int, default=5, help='pages served by FakeAPI.analyze')
+
+
+def config_from_arguments(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, users=args.users,
+                      subscribes=args.subscribes, followers=args.followers, analyze_pages=args.analyze_pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Instapro backend and FakeAPI sub-server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    run_forever(config_from_arguments(args), args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import bisect
+from array import array
+from itertools import accumulate
+from typing import Any, Dict, Iterable, Iterator, List
+
+from .schemas.analyze import OutAnalyze
+
+_SEPARATOR = '\n'
+
+
+class CompactStringSet:
+    """
+    Отсортированное множество строк в одном bytes-буфере со смещениями в array.
+    На списке подписчиков занимает в разы меньше памяти, чем list/set из str
+    """
+
+    __slots__ = ('_blob', '_offsets')
+
+    def __init__(self, values: Iterable[str] = ()):
+        encoded = [item.encode() for item in sorted(set(values))]
+        blob = b'\n'.join(encoded)
+        if encoded and blob.count(b'\n') != len(encoded) - 1:
+            raise ValueError('Values must not contain line breaks')
+        self._blob = blob
+        self._offsets = array('I', accumulate((len(item) + 1 for item in encoded[:-1]), initial=0)
+                              if encoded else ())
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _item(self, index: int) -> bytes:
+        start = self._offsets[index]
+        end = self._offsets[index + 1] - 1 if index + 1 < len(self._offsets) else len(self._blob)
+        return self._blob[start:end]
+
+    def __contains__(self, value: object) -> bool:
+        if not isinstance(value, str) or not self._offsets:
+            return False
+        needle = value.encode()
+        # Порядок bytes в utf-8 совпадает с порядком str, поэтому двоичный поиск по буферу корректен
+        index = bisect.bisect_left(range(len(self._offsets)), needle, key=self._item)
+        return index < len(self._offsets) and self._item(index) == needle
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.to_list())
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, CompactStringSet) and len(self) == len(other) and self._blob == other._blob
+
+    def __repr__(self) -> str:
+        return f'CompactStringSet({len(self)} items, {self.nbytes} bytes)'
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._blob) + self._offsets.itemsize * len(self._offsets)
+
+    def to_list(self) -> List[str]:
+        # Число элементов задают смещения: пустой буфер - это и пустое множество, и {''}
+        return self._blob.decode().split(_SEPARATOR) if self._offsets else []
+
+    def to_set(self) -> set[str]:
+        return set(self.to_list())
+
+    def with_changes(self, append: Iterable[str] = (), remove: Iterable[str] = ()) -> CompactStringSet:
+        values = self.to_set()
+        values.difference_update(remove)
+        values.update(append)
+        return CompactStringSet(values)
+
+
+class CompactAnalyze:
+    """
+    OutAnalyze с данными в CompactStringSet; собирается прямо из JSON, без pydantic-списков
+    """
+
+    __slots__ = ('id', 'username', 'user_id', 'is_subscribe', 'data')
+
+    def __init__(self, id: str, username: str, user_id: str, is_subscribe: bool,
+                 data: Dict[str, CompactStringSet]):
+        self.id = id
+        self.username = username
+        self.user_id = user_id
+        self.is_subscribe = is_subscribe
+        self.data = data
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> CompactAnalyze:
+        return cls(id=payload['id'], username=payload['username'], user_id=payload['user_id'],
+                   is_subscribe=payload['is_subscribe'],
+                   data={key: CompactStringSet(values) for key, values in (payload.get('data') or {}).items()})
+
+    @classmethod
+    def from_analyze(cls, analyze: OutAnalyze) -> CompactAnalyze:
+        return cls(id=analyze.id, username=analyze.username, user_id=analyze.user_id,
+                   is_subscribe=analyze.is_subscribe,
+                   data={key: CompactStringSet(values) for key, values in analyze.data.items()})
+
+    def to_analyze(self) -> OutAnalyze:
+        return OutAnalyze.construct(id=self.id, username=self.username, user_id=self.user_id,
+                                    is_subscribe=self.is_subscribe,
+                                    data={key: values.to_list() for key, values in self.data.items()})
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values.nbytes for values in self.data.values())
+
+
+def build_compact_analyze(data: Any) -> CompactAnalyze | None:
+    if not data:
+        return None
+    return CompactAnalyze.from_payload(data)
+
+
+class AnalyzeDiff:
+    def __init__(self, added: List[str], removed: List[str]):
+        self.added = added
+        self.removed = removed
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed)
+
+    def __repr__(self) -> str:
+        return f'AnalyzeDiff(added={len(self.added)}, removed={len(self.removed)})'
+
+
+def _values(snapshot: OutAnalyze | CompactAnalyze | None, key: str) -> Iterable[str] | CompactStringSet:
+    return snapshot.data.get(key, ()) if snapshot is not None else ()
+
+
+def diff_values(old: Iterable[str] | CompactStringSet, new: Iterable[str] | CompactStringSet) -> AnalyzeDiff:
+    old_set = old.to_set() if isinstance(old, CompactStringSet) else set(old)
+    new_set = new.to_set() if isinstance(new, CompactStringSet) else set(new)
+    return AnalyzeDiff(added=sorted(new_set - old_set), removed=sorted(old_set - new_set))
+
+
+def diff_snapshots(old: OutAnalyze | CompactAnalyze | None, new: OutAnalyze | CompactAnalyze,
+                   keys: Iterable[str] | None = None) -> Dict[str, AnalyzeDiff]:
+    """
+    Разница двух снимков анализа по ключам: added - новые (например, новые подписчики), removed - пропавшие
+    """
+    if keys is None:
+        keys = set(new.data) | (set(old.data) if old is not None else set())
+    return {key: diff_values(_values(old, key), _values(new, key)) for key in keys}
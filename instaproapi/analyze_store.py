@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List
+
+from .schemas.analyze import OutAnalyze
+from .transport import JsonCodec
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS analyze (
+    instance_id TEXT PRIMARY KEY,
+    etag TEXT,
+    digest TEXT NOT NULL,
+    validated_at REAL NOT NULL,
+    meta BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analyze_data (
+    instance_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (instance_id, key)
+);
+'''
+
+
+class StoredAnalyze:
+    def __init__(self, instance_id: str, etag: str | None, digest: str, validated_at: float, meta: Dict[str, Any]):
+        self.instance_id = instance_id
+        self.etag = etag
+        self.digest = digest
+        self.validated_at = validated_at
+        self.meta = meta
+
+
+class AnalyzeDiskCache:
+    """
+    Снимки OutAnalyze на диске (SQLite), каждый ключ data - отдельной строкой, чтобы читать только нужные.
+    Запись считается свежей max_age секунд после последней сверки с сервером; потом клиент сверяет её
+    по ETag (If-None-Match) или по хэшу тела ответа. Все запросы к базе идут через один поток
+    """
+
+    def __init__(self, path: str, max_age: float = 0.0, json_codec: JsonCodec | None = None):
+        self._path = path
+        self._max_age = max_age
+        self._json = json_codec or JsonCodec.default()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='analyze-cache')
+        self._connection: sqlite3.Connection | None = None
+
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'downloads': self.downloads}
+
+    async def _run(self, func: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(_SCHEMA)
+        return self._connection
+
+    async def close(self):
+        def close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        await self._run(close)
+        self._executor.shutdown(wait=False)
+
+    def is_fresh(self, entry: StoredAnalyze) -> bool:
+        return time.time() - entry.validated_at < self._max_age
+
+    async def entry(self, instance_id: str) -> StoredAnalyze | None:
+        def read():
+            return self._db().execute('SELECT etag, digest, validated_at, meta FROM analyze WHERE instance_id = ?',
+                                      (instance_id,)).fetchone()
+
+        row = await self._run(read)
+        if row is None:
+            return None
+        etag, digest, validated_at, meta = row
+        return StoredAnalyze(instance_id, etag, digest, validated_at, self._json.loads(meta))
+
+    async def load(self, instance_id: str, keys: Iterable[str] | None = None) -> Dict[str, List[str]]:
+        def read():
+            if keys is None:
+                return self._db().execute('SELECT key, value FROM analyze_data WHERE instance_id = ?',
+                                          (instance_id,)).fetchall()
+            wanted = list(keys)
+            placeholders = ', '.join('?' * len(wanted))
+            return self._db().execute(f'SELECT key, value FROM analyze_data WHERE instance_id = ? '
+                                      f'AND key IN ({placeholders})', (instance_id, *wanted)).fetchall()
+
+        rows = await self._run(read)
+        self.hits += 1
+        return {key: self._json.loads(value) for key, value in rows}
+
+    async def load_analyze(self, entry: StoredAnalyze) -> OutAnalyze:
+        # В базу попадают только прошедшие сборку OutAnalyze данные, повторная валидация не нужна
+        return OutAnalyze.construct(**entry.meta, data=await self.load(entry.instance_id))
+
+    async def save(self, instance_id: str, payload: Dict[str, Any], etag: str | None, digest: str):
+        meta = self._json.dumps({key: value for key, value in payload.items() if key != 'data'})
+        rows = [(instance_id, key, self._json.dumps(values)) for key, values in (payload.get('data') or {}).items()]
+
+        def write():
+            with self._db() as db:
+                db.execute('DELETE FROM analyze_data WHERE instance_id = ?', (instance_id,))
+                db.executemany('INSERT INTO analyze_data (instance_id, key, value) VALUES (?, ?, ?)', rows)
+                db.execute('INSERT OR REPLACE INTO analyze (instance_id, etag, digest, validated_at, meta) '
+                           'VALUES (?, ?, ?, ?, ?)', (instance_id, etag, digest, time.time(), meta))
+
+        await self._run(write)
+        self.downloads += 1
+
+    async def touch(self, instance_id: str, etag: str | None):
+        def write():
+            with self._db() as db:
+                db.execute('UPDATE analyze SET validated_at = ?, etag = COALESCE(?, etag) WHERE instance_id = ?',
+                           (time.time(), etag, instance_id))
+
+        await self._run(write)
+        self.revalidated += 1
+
+    async def expire(self, instance_id: str):
+        def write():
+            with self._db() as db:
+                db.execute('UPDATE analyze SET validated_at = 0 WHERE instance_id = ?', (instance_id,))
+
+        await self._run(write)
+
+    async def delete(self, instance_id: str):
+        def write():
+            with self._db() as db:
+                db.execute('DELETE FROM analyze_data WHERE instance_id = ?', (instance_id,))
+                db.execute('DELETE FROM analyze WHERE instance_id = ?', (instance_id,))
+
+        await self._run(write)
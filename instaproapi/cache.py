@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import inspect
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class EntityCache:
+    def __init__(self, ttl: Dict[str, float] | None = None, default_ttl: float = 5.0, maxsize: int = 1024):
+        self._ttl = ttl or {}
+        self._default_ttl = default_ttl
+        self._maxsize = maxsize
+        self._data: OrderedDict[Tuple[str, Hashable], Tuple[float, Any]] = OrderedDict()
+        # Момент последней инвалидации ключа по общим часам: чтение, начатое раньше, не должно записать
+        # устаревшее значение. Ключей хранится не больше maxsize; для вытесненных берётся _pruned -
+        # самая поздняя из забытых инвалидаций, так что старое чтение в худшем случае просто не закэшируется
+        self._clock = 0
+        self._versions: OrderedDict[Tuple[str, Hashable], int] = OrderedDict()
+        self._entity_versions: Dict[str, int] = {}
+        self._pruned = 0
+        self.hits = 0
+        self.misses = 0
+
+    def ttl(self, entity: str) -> float:
+        return self._ttl.get(entity, self._default_ttl)
+
+    def version(self) -> int:
+        return self._clock
+
+    def _invalidated_at(self, entity: str, key: Hashable) -> int:
+        return max(self._entity_versions.get(entity, 0), self._versions.get((entity, key), self._pruned))
+
+    def get(self, entity: str, key: Hashable) -> Tuple[bool, Any]:
+        item = self._data.get((entity, key))
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._data.move_to_end((entity, key))
+                self.hits += 1
+                return True, value
+            del self._data[(entity, key)]
+        self.misses += 1
+        return False, None
+
+    def set(self, entity: str, key: Hashable, value: Any, version: int | None = None):
+        if version is not None and self._invalidated_at(entity, key) > version:
+            return
+        ttl = self.ttl(entity)
+        if ttl <= 0:
+            return
+        self._data[(entity, key)] = (time.monotonic() + ttl, value)
+        self._data.move_to_end((entity, key))
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, entity: str, key: Hashable | None = None):
+        self._clock += 1
+        if key is None:
+            self._entity_versions[entity] = self._clock
+            for cache_key in [cache_key for cache_key in self._data if cache_key[0] == entity]:
+                del self._data[cache_key]
+            for cache_key in [cache_key for cache_key in self._versions if cache_key[0] == entity]:
+                del self._versions[cache_key]
+            return
+        self._versions[(entity, key)] = self._clock
+        self._versions.move_to_end((entity, key))
+        while len(self._versions) > self._maxsize:
+            self._pruned = self._versions.popitem(last=False)[1]
+        self._data.pop((entity, key), None)
+
+    def clear(self):
+        for entity in {cache_key[0] for cache_key in self._data} | set(self._entity_versions):
+            self.invalidate(entity)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+def _argument_getter(func, name: str) -> Callable[[tuple, dict], Any]:
+    signature = inspect.signature(func)
+
+    def get(args, kwargs) -> Any:
+        return signature.bind(*args, **kwargs).arguments.get(name)
+
+    return get
+
+
+def cached(entity: str, key_arg: str = 'instance_id'):
+    def decorator(func):
+        get_key = _argument_getter(func, key_arg)
+
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            cache: EntityCache | None = self._cache
+            if cache is None:
+                return await func(self, *args, **kwargs)
+            key = get_key((self, *args), kwargs)
+            hit, value = cache.get(entity, key)
+            if hit:
+                return value
+            version = cache.version()
+            value = await func(self, *args, **kwargs)
+            if value is not None:
+                cache.set(entity, key, value, version)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def invalidates(*targets: Tuple[str, str | None]):
+    """
+    targets: пары (сущность, имя аргумента с ключом); None вместо имени сбрасывает всю сущность
+    """
+
+    def decorator(func):
+        getters = [(entity, None if key_arg is None else _argument_getter(func, key_arg))
+                   for entity, key_arg in targets]
+
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                cache: EntityCache | None = self._cache
+                if cache is not None:
+                    for entity, get_key in getters:
+                        if get_key is None:
+                            cache.invalidate(entity)
+                        else:
+                            cache.invalidate(entity, get_key((self, *args), kwargs))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Set
+
+from aiohttp import ClientResponseError
+from loguru import logger
+
+from .fake_api import FakeAPI
+from .retry import CircuitOpenError
+
+THROTTLE_MARKERS = ('feedback_required', 'please wait', 'rate limit', 'rate_limit', 'too many', 'throttl')
+
+
+def default_is_throttled(response: Any) -> bool:
+    if not isinstance(response, dict):
+        return False
+    text = ' '.join(str(value) for value in response.values()).lower()
+    return any(marker in text for marker in THROTTLE_MARKERS)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self._rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self._tokens -= 1
+
+
+class CampaignJob:
+    def __init__(self, account_id: str, action: str, priority: int, kwargs: Dict[str, Any],
+                 future: asyncio.Future):
+        self.account_id = account_id
+        self.action = action
+        self.priority = priority
+        self.kwargs = kwargs
+        self.future = future
+
+
+class CampaignStats:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.throttled = 0
+
+    @property
+    def actions_per_hour(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.completed / elapsed * 3600 if elapsed > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {'completed': self.completed, 'failed': self.failed, 'throttled': self.throttled,
+                'actions_per_hour': self.actions_per_hour}
+
+
+class CampaignScheduler:
+    """
+    Планировщик like/unfollow поверх FakeAPI: token bucket на аккаунт, общий лимит параллельности,
+    round-robin между аккаунтами внутри приоритета и back-off аккаунта при признаках троттлинга.
+    У одного аккаунта одновременно выполняется не больше одного действия
+    """
+
+    def __init__(self, fake_api: FakeAPI, rate: float = 1 / 30, burst: float = 1, concurrency: int = 20,
+                 throttle_backoff: float = 300.0, max_backoff: float = 3600.0, circuit_retry: float = 1.0,
+                 is_throttled: Callable[[Any], bool] = default_is_throttled):
+        self._fake_api = fake_api
+        self._rate = rate
+        self._burst = burst
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._throttle_backoff = throttle_backoff
+        self._max_backoff = max_backoff
+        self._circuit_retry = circuit_retry
+        self._is_throttled = is_throttled
+
+        # приоритет -> аккаунт -> очередь заданий; кольцо аккаунтов для round-robin
+        self._lanes: Dict[int, Dict[str, Deque[CampaignJob]]] = {}
+        self._rings: Dict[int, Deque[str]] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._blocked_until: Dict[str, float] = {}
+        self._backoff_level: Dict[str, int] = {}
+        self._active: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._queued = 0
+        self._running = 0
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._loop_task: asyncio.Task | None = None
+        self.stats = CampaignStats()
+
+    @property
+    def pending(self) -> int:
+        return self._queued + self._running
+
+    def submit_like(self, account_id: str, instance: str, instance_type, priority: int = 0,
+                    **kwargs) -> asyncio.Future:
+        return self._submit(account_id, 'like', priority,
+                            dict(account_id=account_id, instance=instance, instance_type=instance_type, **kwargs))
+
+    def submit_unfollow(self, account_id: str, action_id: str, instance: str, priority: int = 0) -> asyncio.Future:
+        return self._submit(account_id, 'unfollow', priority, dict(action_id=action_id, instance=instance))
+
+    def _submit(self, account_id: str, action: str, priority: int, kwargs: Dict[str, Any]) -> asyncio.Future:
+        if self._closing:
+            raise RuntimeError('Campaign scheduler is stopping')
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(CampaignJob(account_id, action, priority, kwargs, future))
+        return future
+
+    def _enqueue(self, job: CampaignJob, front: bool = False):
+        lane = self._lanes.setdefault(job.priority, {})
+        ring = self._rings.setdefault(job.priority, deque())
+        if job.account_id not in lane:
+            lane[job.account_id] = deque()
+            ring.append(job.account_id)
+        if front:
+            lane[job.account_id].appendleft(job)
+        else:
+            lane[job.account_id].append(job)
+        self._queued += 1
+        self._wakeup.set()
+
+    def _bucket(self, account_id: str) -> TokenBucket:
+        bucket = self._buckets.get(account_id)
+        if bucket is None:
+            bucket = self._buckets[account_id] = TokenBucket(self._rate, self._burst)
+        return bucket
+
+    def _pick(self) -> tuple[CampaignJob | None, float]:
+        now = time.monotonic()
+        wait = math.inf
+        for priority in sorted(self._rings, reverse=True):
+            ring = self._rings[priority]
+            for _ in range(len(ring)):
+                account_id = ring[0]
+                ring.rotate(-1)
+                if account_id in self._active:
+                    continue
+                blocked = self._blocked_until.get(account_id, 0.0) - now
+                if blocked > 0:
+                    wait = min(wait, blocked)
+                    continue
+                bucket = self._bucket(account_id)
+                bucket_wait = bucket.wait_time(now)
+                if bucket_wait > 0:
+                    wait = min(wait, bucket_wait)
+                    continue
+                bucket.take(now)
+                jobs = self._lanes[priority][account_id]
+                job = jobs.popleft()
+                if not jobs:
+                    del self._lanes[priority][account_id]
+                    ring.remove(account_id)
+                self._queued -= 1
+                return job, 0.0
+        return None, wait
+
+    def start(self):
+        if self._loop_task is None:
+            self._loop_task = asyncio.ensure_future(self._run())
+
+    async def stop(self, drain: bool = True):
+        self._closing = True
+        self._wakeup.set()
+        if not drain:
+            for lane in self._lanes.values():
+                for jobs in lane.values():
+                    for job in jobs:
+                        job.future.cancel()
+            self._lanes.clear()
+            self._rings.clear()
+            self._queued = 0
+        if self._loop_task is not None:
+            await self._loop_task
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def join(self):
+        self.start()
+        await self.stop(drain=True)
+
+    async def _run(self):
+        while True:
+            await self._semaphore.acquire()
+            self._wakeup.clear()
+            job, wait = self._pick()
+            if job is None:
+                self._semaphore.release()
+                if self._closing and not self.pending:
+                    return
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), None if wait == math.inf else wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._active.add(job.account_id)
+            self._running += 1
+            task = asyncio.ensure_future(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job: CampaignJob):
+        try:
+            throttled = False
+            try:
+                response = await getattr(self._fake_api, job.action)(**job.kwargs)
+            except CircuitOpenError as e:
+                # Сабсервер временно закрыт для всех аккаунтов: задание не провалено, повторим позже
+                self._blocked_until[job.account_id] = time.monotonic() + max(e.retry_after, self._circuit_retry)
+                self._enqueue(job, front=True)
+                return
+            except ClientResponseError as e:
+                if e.status != 429:
+                    raise
+                throttled = True
+            else:
+                throttled = self._is_throttled(response)
+            if throttled:
+                self._throttle(job)
+            else:
+                self._backoff_level.pop(job.account_id, None)
+                self.stats.completed += 1
+                if not job.future.done():
+                    job.future.set_result(response)
+        except Exception as e:
+            self.stats.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self._running -= 1
+            self._active.discard(job.account_id)
+            self._semaphore.release()
+            self._wakeup.set()
+
+    def _throttle(self, job: CampaignJob):
+        level = self._backoff_level.get(job.account_id, 0)
+        delay = min(self._max_backoff, self._throttle_backoff * 2 ** level)
+        self._backoff_level[job.account_id] = level + 1
+        self._blocked_until[job.account_id] = time.monotonic() + delay
+        self.stats.throttled += 1
+        logger.warning(f'Account {job.account_id} throttled on {job.action}, backing off for {delay:.1f}s')
+        self._enqueue(job, front=True)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import zlib
+from typing import Dict, Mapping
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+SUPPORTED_ENCODINGS = ('zstd', 'gzip', 'deflate') if zstandard is not None else ('gzip', 'deflate')
+
+
+class BodyDecoder:
+    """
+    Потоковая распаковка тела ответа: чанки распаковываются по мере чтения, сжатое тело целиком не копится
+    """
+
+    def __init__(self, encoding: str | None):
+        encoding = (encoding or 'identity').strip().lower()
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        elif encoding == 'zstd':
+            if zstandard is None:
+                raise RuntimeError('zstandard is not installed')
+            self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+        elif encoding == 'identity':
+            self._decompressor = None
+        else:
+            raise ValueError(f'Unsupported Content-Encoding: {encoding}')
+
+    def feed(self, chunk: bytes) -> bytes:
+        return self._decompressor.decompress(chunk) if self._decompressor is not None else chunk
+
+    def flush(self) -> bytes:
+        return self._decompressor.flush() if self._decompressor is not None else b''
+
+
+class CompressionStats:
+    def __init__(self):
+        self.requests = 0
+        self.compressed_requests = 0
+        self.request_bytes = 0
+        self.request_wire_bytes = 0
+        self.response_wire_bytes = 0
+        self.response_bytes = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {'requests': self.requests, 'compressed_requests': self.compressed_requests,
+                'request_bytes': self.request_bytes, 'request_wire_bytes': self.request_wire_bytes,
+                'response_wire_bytes': self.response_wire_bytes, 'response_bytes': self.response_bytes}
+
+
+class CompressionPolicy:
+    """
+    Сжатие тел запросов больше threshold байт и Accept-Encoding для ответов.
+    endpoints переопределяет кодировку запроса по имени метода клиента или пути (None - не сжимать).
+    Счётчики байт до и после сжатия ведутся по эндпоинтам
+    """
+
+    def __init__(self, encoding: str | None = 'gzip', threshold: int = 16 * 1024,
+                 endpoints: Mapping[str, str | None] | None = None, gzip_level: int = 5, zstd_level: int = 3,
+                 accept_encoding: str | None = None):
+        for value in (encoding, *(endpoints or {}).values()):
+            if value is not None and value not in SUPPORTED_ENCODINGS:
+                raise ValueError(f'Unsupported encoding: {value}')
+        self._encoding = encoding
+        self._threshold = threshold
+        self._endpoints = dict(endpoints or {})
+        self._gzip_level = gzip_level
+        self._zstd_compressor = zstandard.ZstdCompressor(level=zstd_level) if zstandard is not None else None
+        self.accept_encoding = accept_encoding or ', '.join(SUPPORTED_ENCODINGS)
+        self._stats: Dict[str, CompressionStats] = {}
+
+    def encoding_for(self, endpoint: str, path: str) -> str | None:
+        if endpoint in self._endpoints:
+            return self._endpoints[endpoint]
+        return self._endpoints.get(path, self._encoding)
+
+    def compress(self, endpoint: str, path: str, body: bytes) -> tuple[bytes, str | None]:
+        encoding = self.encoding_for(endpoint, path)
+        if encoding is None or len(body) < self._threshold:
+            return body, None
+        if encoding == 'zstd':
+            return self._zstd_compressor.compress(body), encoding
+        if encoding == 'gzip':
+            return zlib.compress(body, self._gzip_level, wbits=16 + zlib.MAX_WBITS), encoding
+        return zlib.compress(body, self._gzip_level), encoding
+
+    def observe(self, endpoint: str, compressed: bool, request_bytes: int, request_wire_bytes: int,
+                response_wire_bytes: int, response_bytes: int):
+        stats = self._stats.get(endpoint)
+        if stats is None:
+            stats = self._stats[endpoint] = CompressionStats()
+        stats.requests += 1
+        stats.compressed_requests += compressed
+        stats.request_bytes += request_bytes
+        stats.request_wire_bytes += request_wire_bytes
+        stats.response_wire_bytes += response_wire_bytes
+        stats.response_bytes += response_bytes
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {endpoint: stats.as_dict() for endpoint, stats in self._stats.items()}
@@ -3,76 +3,133 @@
 from __future__ import annotations
 
 import asyncio
-from functools import wraps
-from typing import Dict
+from typing import Any, AsyncIterator, Dict, Iterable, Mapping, Tuple
 
-from aiohttp import ClientSession, TCPConnector
 from loguru import logger
 
+from .compression import CompressionPolicy
+from .limiter import ConcurrencyLimiter
+from .metrics import MetricsSink
+from .offload import Offloader
+from .priority import Priority, with_priority
+from .retry import RetryPolicy
 from .schemas.fake import InstanceTypes
+from .single_flight import SingleFlight, coalesced
+from .transport import BaseTransport, JsonCodec, retry_async
 
+_DONE = object()
 
-class FakeAPI:
-    def __init__(self, host: str, port: int):
-        self._host = host
-        self._port = port
-        self._client_session: ClientSession | None = None
+# 429 на like/unfollow - троттлинг одного аккаунта, а не отказ сабсервера
+ACCOUNT_THROTTLE_STATUSES = frozenset({429})
 
-    async def start(self):
-        connector = TCPConnector(limit=50)
-        self._client_session = ClientSession(connector=connector)
 
-    async def stop(self):
-        await self._client_session.close()
-
-    @property
-    def base_url(self) -> str:
-        return f'http://{self._host}:{self._port}{{method}}'
-
-    @staticmethod
-    def retry_async(num_tries):
-        def decorator(func):
-            @wraps(func)
-            async def wrapper(*args, **kwargs):
-                for i in range(num_tries):
-                    try:
-                        return await func(*args, **kwargs)
-                    except Exception as e:
-                        if i == num_tries - 1:
-                            logger.error(e)
-                            raise e
-                        await asyncio.sleep(0.02)
-
-            return wrapper
-
-        return decorator
+class FakeAPI(BaseTransport):
+    def __init__(self, host: str, port: int, coalesce_reads: bool = True, json_codec: JsonCodec | None = None,
+                 retry_policy: RetryPolicy | None = None, offloader: Offloader | None = None,
+                 metrics: MetricsSink | None = None, compression: CompressionPolicy | None = None,
+                 limiter: ConcurrencyLimiter | None = None):
+        super().__init__(host, port, json_codec=json_codec, retry_policy=retry_policy, offloader=offloader,
+                         metrics=metrics, compression=compression, limiter=limiter)
+        self._single_flight = SingleFlight() if coalesce_reads else None
 
     """
     Фейки
     """
 
+    @with_priority(Priority.background)
+    @coalesced
     @retry_async(3)
     async def analyze(self, instance: str, last_max_id: str | None) -> Dict[str, str]:
         params = {'instance': instance}
         if last_max_id:
             params['last_max_id'] = last_max_id
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/analyze/analyze'),
-            params=params)
-        return await response.json()
-
-    @retry_async(3)
+        return await self._post('/api/analyze/analyze', params=params)
+
+    async def iter_analyze(self, instance: str, last_max_id: str | None = None, prefetch: int = 2,
+                           semaphore: asyncio.Semaphore | None = None,
+                           cursor_key: str = 'last_max_id') -> AsyncIterator[Dict[str, Any]]:
+        """
+        Страницы analyze по last_max_id; пока потребитель обрабатывает страницу, следующие prefetch уже грузятся.
+        page[cursor_key] - курсор для продолжения с места остановки
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, prefetch))
+
+        async def produce():
+            cursor = last_max_id
+            try:
+                while True:
+                    if semaphore is not None:
+                        async with semaphore:
+                            page = await self.analyze(instance, cursor)
+                    else:
+                        page = await self.analyze(instance, cursor)
+                    await queue.put(page)
+                    next_cursor = page.get(cursor_key) if isinstance(page, dict) else None
+                    if not next_cursor or next_cursor == cursor:
+                        break
+                    cursor = next_cursor
+            except Exception as e:
+                await queue.put(e)
+                return
+            await queue.put(_DONE)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                page = await queue.get()
+                if page is _DONE:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            producer.cancel()
+
+    async def crawl_analyze(self, instances: Mapping[str, str | None] | Iterable[str], prefetch: int = 2,
+                            concurrency: int = 10, cursor_key: str = 'last_max_id',
+                            return_exceptions: bool = False
+                            ) -> AsyncIterator[Tuple[str, Dict[str, Any] | Exception]]:
+        """
+        Обход многих инстансов сразу: отдаёт пары (instance, page) по мере готовности.
+        instances - список или словарь instance -> сохранённый курсор; concurrency - общий лимит запросов.
+        Сбой инстанса не останавливает остальные; с return_exceptions он приходит парой (instance, exception),
+        и обход этого инстанса можно продолжить с cursor_key последней полученной страницы
+        """
+        cursors = dict(instances) if isinstance(instances, Mapping) else dict.fromkeys(instances)
+        semaphore = asyncio.Semaphore(concurrency)
+        output: asyncio.Queue = asyncio.Queue(maxsize=max(1, concurrency))
+
+        async def crawl(instance: str, cursor: str | None):
+            try:
+                async for page in self.iter_analyze(instance, cursor, prefetch=prefetch, semaphore=semaphore,
+                                                    cursor_key=cursor_key):
+                    await output.put((instance, page))
+            except Exception as e:
+                logger.error(f'crawl_analyze({instance}) failed: {e!r}')
+                if return_exceptions:
+                    await output.put((instance, e))
+            await output.put((instance, _DONE))
+
+        workers = [asyncio.ensure_future(crawl(instance, cursor)) for instance, cursor in cursors.items()]
+        try:
+            remaining = len(workers)
+            while remaining:
+                instance, page = await output.get()
+                if page is _DONE:
+                    remaining -= 1
+                    continue
+                yield instance, page
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    @retry_async(3, idempotent=False, breaker_exempt=ACCOUNT_THROTTLE_STATUSES)
     async def unfollow(self, action_id: str, instance: str) -> Dict[str, str]:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/analyze/unfollow'),
-            params={'action_id': action_id, 'instance': instance})
-        return await response.json()
+        return await self._post('/api/analyze/unfollow', params={'action_id': action_id, 'instance': instance})
 
-    @retry_async(3)
+    @retry_async(3, idempotent=False, breaker_exempt=ACCOUNT_THROTTLE_STATUSES)
     async def like(self, account_id: str, instance: str, instance_type: InstanceTypes,
                    last_max_id: str | None = None, bio: str | None = None) -> Dict[str, str]:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/story_like/like'),
-            params={'instance': instance, 'last_max_id': last_max_id, 'instance_type': instance_type,
-                    'account_id': account_id, 'bio': bio})
-        return await response.json()
+        return await self._post('/api/story_like/like',
+                                params={'instance': instance, 'last_max_id': last_max_id,
+                                        'instance_type': instance_type, 'account_id': account_id, 'bio': bio})
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from aiohttp import ClientResponseError
+from loguru import logger
+
+from .fake_api import ACCOUNT_THROTTLE_STATUSES, FakeAPI
+from .insta_pro_api import InstaproAPI
+from .retry import DEFAULT_RETRY_POLICY, CircuitOpenError, ErrorKind
+from .schemas.fake import InstanceTypes
+from .schemas.sub_server import OutSubServer
+from .transport import TransportOptions
+
+
+class NoHealthySubServerError(Exception):
+    pass
+
+
+class SubServerHost:
+    def __init__(self, sub_server: OutSubServer, fake_api: FakeAPI):
+        self.sub_server = sub_server
+        self.fake_api = fake_api
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def id(self) -> str:
+        return self.sub_server.id
+
+    def is_healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+
+class FakeAPIPool:
+    """
+    Балансировщик FakeAPI по сабсерверам из InstaproAPI: свой FakeAPI (и пул соединений) на каждый хост.
+    Запрос уходит на сабсервер аккаунта (OutAccount.sub_server_id), если тот здоров, иначе - на хост
+    с наименьшим числом незавершённых запросов. После failure_threshold ошибок подряд или неудачной
+    проверки здоровья хост исключается на eject_time секунд
+    """
+
+    def __init__(self, api: InstaproAPI, refresh_interval: float = 60.0, health_interval: float = 5.0,
+                 health_timeout: float = 1.0, failure_threshold: int = 3, eject_time: float = 30.0,
+                 fake_api_factory: Callable[[str, int], FakeAPI] | None = None,
+                 transport_options: TransportOptions | None = None):
+        self._api = api
+        self._refresh_interval = refresh_interval
+        self._health_interval = health_interval
+        self._health_timeout = health_timeout
+        self._failure_threshold = failure_threshold
+        self._eject_time = eject_time
+        self._fake_api_factory = fake_api_factory or FakeAPI
+        self._transport_options = transport_options
+        self._hosts: Dict[str, SubServerHost] = {}
+        self._affinity: Dict[str, str] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def hosts(self) -> List[SubServerHost]:
+        return list(self._hosts.values())
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        stats = {}
+        for host in self._hosts.values():
+            stats[host.id] = {'outstanding': host.outstanding, 'requests': host.requests, 'errors': host.errors,
+                              'healthy': host.is_healthy(now)}
+            if (limiter := host.fake_api.limiter) is not None:
+                stats[host.id].update(limit=limiter.limit, queue_depth=limiter.queue_depth)
+        return stats
+
+    async def start(self):
+        await self.refresh()
+        await self.health_check()
+        self._tasks = [asyncio.ensure_future(self._every(self._refresh_interval, self.refresh)),
+                       asyncio.ensure_future(self._every(self._health_interval, self.health_check))]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        hosts, self._hosts = self._hosts, {}
+        await asyncio.gather(*[host.fake_api.stop() for host in hosts.values()], return_exceptions=True)
+
+    @staticmethod
+    async def _every(interval: float, func: Callable):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await func()
+            except Exception as e:
+                logger.error(f'{func.__name__} failed: {e!r}')
+
+    async def refresh(self):
+        sub_servers = {sub_server.id: sub_server for sub_server in await self._api.get_all_sub_servers()}
+        for sub_server_id in list(self._hosts):
+            host = self._hosts[sub_server_id]
+            sub_server = sub_servers.get(sub_server_id)
+            if sub_server is None or (sub_server.host, sub_server.port) != (host.sub_server.host,
+                                                                            host.sub_server.port):
+                del self._hosts[sub_server_id]
+                # Незавершённые запросы удалённого хоста дорабатывают на его сессии
+                asyncio.ensure_future(self._close_when_idle(host))
+        for sub_server_id, sub_server in sub_servers.items():
+            if sub_server_id not in self._hosts:
+                fake_api = self._fake_api_factory(sub_server.host, sub_server.port)
+                await fake_api.start(self._transport_options)
+                self._hosts[sub_server_id] = SubServerHost(sub_server, fake_api)
+
+    @staticmethod
+    async def _close_when_idle(host: SubServerHost):
+        while host.outstanding:
+            await asyncio.sleep(0.1)
+        await host.fake_api.stop()
+
+    async def health_check(self):
+        await asyncio.gather(*[self._probe(host) for host in list(self._hosts.values())])
+
+    async def _probe(self, host: SubServerHost):
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host.sub_server.host, host.sub_server.port),
+                                               self._health_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self._eject(host, f'health check failed: {e!r}')
+            return
+        writer.close()
+        if not host.is_healthy(time.monotonic()):
+            logger.info(f'Sub-server {host.id} is back')
+        host.ejected_until = 0.0
+        host.failures = 0
+
+    def _eject(self, host: SubServerHost, reason: str):
+        if host.is_healthy(time.monotonic()):
+            logger.warning(f'Sub-server {host.id} ejected for {self._eject_time:.0f}s: {reason}')
+        host.ejected_until = time.monotonic() + self._eject_time
+
+    async def _sub_server_id(self, account_id: str) -> str | None:
+        sub_server_id = self._affinity.get(account_id)
+        if sub_server_id is None:
+            account = await self._api.get_account(account_id)
+            if account is None or not account.sub_server_id:
+                return None
+            sub_server_id = self._affinity[account_id] = account.sub_server_id
+        return sub_server_id
+
+    async def pick(self, account_id: str | None = None) -> SubServerHost:
+        now = time.monotonic()
+        if account_id is not None:
+            host = self._hosts.get(await self._sub_server_id(account_id))
+            if host is not None and host.is_healthy(now):
+                return host
+        healthy = [host for host in self._hosts.values() if host.is_healthy(now)]
+        if not healthy:
+            raise NoHealthySubServerError('No healthy sub-servers available')
+        least = min(host.outstanding for host in healthy)
+        return random.choice([host for host in healthy if host.outstanding == least])
+
+    @asynccontextmanager
+    async def _lease(self, account_id: str | None = None,
+                     exempt: frozenset[int] = frozenset()) -> AsyncIterator[FakeAPI]:
+        """
+        exempt - коды ответа, которые относятся к аккаунту, а не к хосту (429 на like/unfollow):
+        хост ответил, поэтому серия его отказов сбрасывается, как и в circuit breaker
+        """
+        host = await self.pick(account_id)
+        host.outstanding += 1
+        host.requests += 1
+        try:
+            yield host.fake_api
+        except Exception as e:
+            host.errors += 1
+            if isinstance(e, ClientResponseError) and e.status in exempt:
+                host.failures = 0
+            elif isinstance(e, CircuitOpenError) or DEFAULT_RETRY_POLICY.classify(e) != ErrorKind.permanent:
+                host.failures += 1
+                if host.failures >= self._failure_threshold:
+                    self._eject(host, f'{host.failures} failures in a row, last: {e!r}')
+            raise
+        else:
+            host.failures = 0
+        finally:
+            host.outstanding -= 1
+
+    """
+    Вызовы FakeAPI
+    """
+
+    async def analyze(self, instance: str, last_max_id: str | None, account_id: str | None = None) -> Dict[str, str]:
+        async with self._lease(account_id) as fake_api:
+            return await fake_api.analyze(instance, last_max_id)
+
+    async def iter_analyze(self, instance: str, last_max_id: str | None = None, prefetch: int = 2,
+                           account_id: str | None = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        # Курсор пагинации привязан к сабсерверу, поэтому все страницы идут через один хост
+        async with self._lease(account_id) as fake_api:
+            async for page in fake_api.iter_analyze(instance, last_max_id, prefetch=prefetch, **kwargs):
+                yield page
+
+    async def unfollow(self, action_id: str, instance: str, account_id: str | None = None) -> Dict[str, str]:
+        if account_id is None:
+            action = await self._api.get_action(action_id)
+            account_id = action.account_id if action is not None else None
+        async with self._lease(account_id, ACCOUNT_THROTTLE_STATUSES) as fake_api:
+            return await fake_api.unfollow(action_id, instance)
+
+    async def like(self, account_id: str, instance: str, instance_type: InstanceTypes,
+                   last_max_id: str | None = None, bio: str | None = None) -> Dict[str, str]:
+        async with self._lease(account_id, ACCOUNT_THROTTLE_STATUSES) as fake_api:
+            return await fake_api.like(account_id, instance, instance_type, last_max_id=last_max_id, bio=bio)
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from functools import wraps
+from typing import Deque, Dict, Iterable
+
+from .retry import RetryBudget
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 256, recompute_every: int = 16):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._recompute_every = recompute_every
+        self._since_recompute = 0
+        self._cached: Dict[float, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, duration: float):
+        self._samples.append(duration)
+        self._since_recompute += 1
+        if self._since_recompute >= self._recompute_every:
+            self._since_recompute = 0
+            self._cached.clear()
+
+    def percentile(self, q: float) -> float:
+        value = self._cached.get(q)
+        if value is None:
+            ordered = sorted(self._samples)
+            value = self._cached[q] = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return value
+
+
+class HedgePolicy:
+    """
+    Хеджирование идемпотентных чтений: если ответа нет дольше percentile недавних задержек метода,
+    уходит дубль запроса, побеждает первый ответ, второй отменяется. Дубли тратят токены budget,
+    каждый запрос пополняет его на ratio - дополнительная нагрузка не больше ratio от потока.
+    endpoints - имена методов клиента, для которых хеджирование включено (None - все помеченные @hedged)
+    """
+
+    def __init__(self, percentile: float = 0.95, min_delay: float = 0.005, max_delay: float = 1.0,
+                 min_samples: int = 20, window: int = 256, budget: RetryBudget | None = None,
+                 endpoints: Iterable[str] | None = None):
+        self._percentile = percentile
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._min_samples = min_samples
+        self._window = window
+        self.budget = budget or RetryBudget(ratio=0.05, max_tokens=5.0)
+        self._endpoints = set(endpoints) if endpoints is not None else None
+        self._latencies: Dict[str, LatencyWindow] = {}
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {'requests': self.requests, 'hedged': self.hedged, 'hedge_wins': self.hedge_wins,
+                **{f'{endpoint}_delay': self.delay(endpoint) or 0.0 for endpoint in self._latencies}}
+
+    def enabled(self, endpoint: str) -> bool:
+        return self._endpoints is None or endpoint in self._endpoints
+
+    def delay(self, endpoint: str) -> float | None:
+        """
+        Через сколько отправлять дубль; None - пока мало замеров, хеджировать рано
+        """
+        latencies = self._latencies.get(endpoint)
+        if latencies is None or len(latencies) < self._min_samples:
+            return None
+        return min(self._max_delay, max(self._min_delay, latencies.percentile(self._percentile)))
+
+    def observe(self, endpoint: str, duration: float):
+        latencies = self._latencies.get(endpoint)
+        if latencies is None:
+            latencies = self._latencies[endpoint] = LatencyWindow(self._window)
+        latencies.observe(duration)
+
+
+def hedged(func):
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        policy: HedgePolicy | None = getattr(self, '_hedge_policy', None)
+        endpoint = func.__name__
+        if policy is None or not policy.enabled(endpoint):
+            return await func(self, *args, **kwargs)
+        policy.requests += 1
+        policy.budget.deposit()
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(func(self, *args, **kwargs))
+        delay = policy.delay(endpoint)
+        if delay is not None:
+            try:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+            except asyncio.CancelledError:
+                primary.cancel()
+                raise
+        if delay is None or done or not policy.budget.withdraw():
+            result = await primary
+            policy.observe(endpoint, time.perf_counter() - started)
+            return result
+
+        policy.hedged += 1
+        hedge = asyncio.ensure_future(func(self, *args, **kwargs))
+        pending = {primary, hedge}
+        error: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    policy.hedge_wins += task is hedge
+                    policy.observe(endpoint, time.perf_counter() - started)
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    return wrapper
@@ -3,14 +3,24 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 from datetime import datetime
-from functools import wraps
-from json import JSONDecodeError
-from typing import List, Dict
+from functools import partial
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Iterable, Tuple, Type
 
-from aiohttp import ClientSession, TCPConnector, ContentTypeError
 from loguru import logger
 
+from .analyze_data import CompactAnalyze, build_compact_analyze, diff_values
+from .analyze_store import AnalyzeDiskCache, StoredAnalyze
+from .cache import EntityCache, cached, invalidates
+from .compression import CompressionPolicy
+from .hedging import HedgePolicy, hedged
+from .limiter import ConcurrencyLimiter
+from .metrics import MetricsSink
+from .notifications import NotificationDispatcher, RecipientResolver
+from .offload import Offloader, build_model, build_models
+from .priority import Priority, with_priority
+from .retry import RetryPolicy
 from .schemas.account import OutAccount
 from .schemas.action import OutAction
 from .schemas.analyze import OutAnalyze
@@ -19,499 +29,707 @@ from .schemas.proxy import OutProxy
 from .schemas.server_types import ActionStatuses, ActionTypes
 from .schemas.sub_server import OutSubServer
 from .schemas.user import OutUser
-
-
-class InstaproAPI:
-    def __init__(self, host: str, port: int):
-        self._host = host
-        self._port = port
-        self._client_session: ClientSession | None = None
-
-    async def start(self):
-        connector = TCPConnector(limit=50)
-        self._client_session = ClientSession(connector=connector)
+from .single_flight import SingleFlight, coalesced
+from .streaming import batched
+from .transport import BaseTransport, JsonCodec, TransportOptions, log_payload, retry_async
+from .trusted import construct_trusted
+from .write_behind import WriteBehindBuffer, discards_write, reads_own_writes, write_behind
+
+
+# Так отвечает бэкенд, на котором необязательного эндпоинта нет
+_MISSING_ENDPOINT_STATUSES = frozenset({404, 405, 501})
+
+
+class InstaproAPI(BaseTransport):
+    def __init__(self, host: str, port: int, bulk_concurrency: int = 10, cache: EntityCache | None = None,
+                 coalesce_reads: bool = True, json_codec: JsonCodec | None = None,
+                 retry_policy: RetryPolicy | None = None, offloader: Offloader | None = None,
+                 trusted: bool = False, metrics: MetricsSink | None = None,
+                 write_behind_buffer: WriteBehindBuffer | None = None,
+                 notifier: NotificationDispatcher | None = None,
+                 analyze_store: AnalyzeDiskCache | None = None, compression: CompressionPolicy | None = None,
+                 hedge_policy: HedgePolicy | None = None, limiter: ConcurrencyLimiter | None = None):
+        super().__init__(host, port, json_codec=json_codec, retry_policy=retry_policy, offloader=offloader,
+                         metrics=metrics, compression=compression, limiter=limiter)
+        # Ответы собственного бэкенда можно собирать без полной валидации pydantic
+        self._trusted = trusted
+        self._cache = cache
+        self._single_flight = SingleFlight() if coalesce_reads else None
+        # Общий для всех bulk-методов лимит, чтобы они не выбирали весь пул TCPConnector
+        self._bulk_semaphore = asyncio.Semaphore(bulk_concurrency)
+        self._write_behind = write_behind_buffer
+        # Есть ли на сервере необязательные эндпоинты; нет ключа - ещё не проверяли
+        self._optional_endpoints: Dict[str, bool] = {}
+        self._probe_locks: Dict[str, asyncio.Lock] = {}
+        self._notifier = notifier
+        self._recipients = RecipientResolver()
+        self._analyze_store = analyze_store
+        # Хеджирование включается только явно: дубли запросов - лишняя нагрузка на бэкенд
+        self._hedge_policy = hedge_policy
+
+    async def start(self, options: TransportOptions | None = None, **kwargs):
+        await super().start(options, **kwargs)
+        if self._write_behind is not None:
+            self._write_behind.start()
+        if self._notifier is not None:
+            self._notifier.start()
 
     async def stop(self):
-        await self._client_session.close()
+        if self._notifier is not None:
+            await self._notifier.stop()
+        # Сначала дописываем отложенные set_data/set_result, пока сессия ещё открыта
+        if self._write_behind is not None:
+            await self._write_behind.stop()
+        await super().stop()
+        if self._analyze_store is not None:
+            await self._analyze_store.close()
+
+    @property
+    def cache(self) -> EntityCache | None:
+        return self._cache
 
     @property
-    def base_url(self) -> str:
-        return f'http://{self._host}:{self._port}{{method}}'
-
-    import asyncio
-    from functools import wraps
-    @staticmethod
-    def retry_async(num_tries):
-        def decorator(func):
-            @wraps(func)
-            async def wrapper(*args, **kwargs):
-                for i in range(num_tries):
-                    try:
-                        return await func(*args, **kwargs)
-                    except Exception as e:
-                        if i == num_tries - 1:
-                            logger.error(e)
-                            raise e
-                        await asyncio.sleep(0.02)
-
-            return wrapper
-
-        return decorator
+    def hedge_policy(self) -> HedgePolicy | None:
+        return self._hedge_policy
+
+    async def flush(self):
+        if self._write_behind is not None:
+            await self._write_behind.flush()
+
+    def _build(self, model: Type[Any], data: Dict[str, Any]) -> Any:
+        return construct_trusted(model, data) if self._trusted else model(**data)
+
+    async def _gather_bulk(self, getter: Callable[[str], Awaitable[Any]], instance_ids: List[str],
+                           return_exceptions: bool = False) -> List[Any]:
+        async def fetch(instance_id: str):
+            async with self._bulk_semaphore:
+                try:
+                    return await getter(instance_id)
+                except Exception as e:
+                    logger.error(f'{getter.__name__}({instance_id}) failed: {e!r}')
+                    return e
+
+        results = await asyncio.gather(*[fetch(instance_id) for instance_id in instance_ids])
+        if return_exceptions:
+            return results
+        return [result for result in results if result is not None and not isinstance(result, Exception)]
+
+    def _decode_value(self, text: str) -> Any:
+        if not text or text == 'null':
+            return None
+        try:
+            return self._json.loads(text)
+        except ValueError:
+            # Старый бэкенд мог отдавать значение не в JSON
+            return text
+
+    @retry_async(3, endpoint_arg='method')
+    async def _probe_optional(self, method: str, json: Dict[str, Any], write: bool = False) -> Tuple[bool, Any]:
+        """
+        Запрос к эндпоинту, которого может не быть на старом бэкенде: 404/405/501 или ответ без JSON-объекта
+        значат, что его нет, прочие коды >= 400 - ошибка. Для записи (write) любой 2xx - запись применена,
+        каким бы ни было тело. Результат проверки запоминается в _optional_endpoints
+        """
+        status, content_type, headers, body = await self._request(method, json)
+        if status in _MISSING_ENDPOINT_STATUSES:
+            data = None
+        elif status >= 400:
+            raise self._status_error(method, status, headers)
+        else:
+            data = await self._decode(content_type, body)
+        available = status not in _MISSING_ENDPOINT_STATUSES and (write or isinstance(data, dict))
+        if not available:
+            logger.info(f'{method} is not available (status {status}), falling back')
+        self._optional_endpoints[method] = available
+        return available, data
+
+    async def _call_optional(self, method: str, json: Dict[str, Any], write: bool = False) -> Tuple[bool, Any]:
+        if method not in self._optional_endpoints:
+            # Пока эндпоинт не проверен, запрос к нему один: остальные ждут результата, а не шлют свои 404
+            async with self._probe_locks.setdefault(method, asyncio.Lock()):
+                if method not in self._optional_endpoints:
+                    return await self._probe_optional(method, json, write)
+        if not self._optional_endpoints[method]:
+            return False, None
+        return await self._probe_optional(method, json, write)
+
+    async def _get_values_many(self, kind: str, instance_id: str, keys: Iterable[str],
+                               getter: Callable[[str, str], Awaitable[Any]]) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            found, value = self._write_behind.lookup(kind, instance_id, key) if self._write_behind else (False, None)
+            if found:
+                values[key] = value
+            else:
+                missing.append(key)
+        if not missing:
+            return values
+        method = f'/api/actions/get_{kind}_many'
+        async with self._bulk_semaphore:
+            available, response = await self._call_optional(method, {'instance_id': instance_id, 'keys': missing})
+        if available:
+            values.update((key, response.get(key)) for key in missing)
+            return values
+
+        async def fetch(key: str):
+            async with self._bulk_semaphore:
+                return await getter(instance_id, key)
+
+        values.update(zip(missing, await asyncio.gather(*[fetch(key) for key in missing])))
+        return values
+
+    async def _get_values_bulk(self, kind: str, instances_ids: List[str], keys: List[str],
+                               many_getter: Callable[[str, Iterable[str]], Awaitable[Dict[str, Any]]]
+                               ) -> Dict[str, Dict[str, Any]]:
+        instances_ids = list(dict.fromkeys(instances_ids))
+        method = f'/api/actions/get_{kind}_bulk'
+        # При отложенной записи batch-ответ пришлось бы сверять с буфером - идём через *_many
+        if self._write_behind is None:
+            available, response = await self._call_optional(method, {'instances_ids': instances_ids, 'keys': keys})
+            if available:
+                return {instance_id: {key: (response.get(instance_id) or {}).get(key) for key in keys}
+                        for instance_id in instances_ids}
+        # Каждый запрос *_many и его запасные одиночные чтения идут под общим _bulk_semaphore
+        results = await asyncio.gather(*[many_getter(instance_id, keys) for instance_id in instances_ids])
+        return dict(zip(instances_ids, results))
+
+    async def _iter_models(self, model: Type[Any], method: str, json: Dict[str, Any] | None = None,
+                           batch_size: int | None = None, page_size: int | None = None) -> AsyncIterator[Any]:
+        models = (self._build(model, data) async for data in self._iter_list(method, json=json, page_size=page_size))
+        if batch_size is None:
+            async for item in models:
+                yield item
+        else:
+            async for batch in batched(models, batch_size):
+                yield batch
 
     """
     Фейки
     """
 
-    @retry_async(3)
+    @invalidates(('fake', 'instance_id'))
+    @retry_async(3, idempotent=False)
     async def create_fake(self, instance_id) -> OutFake:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/fakes/create'),
-            json={'instance_id': instance_id})
-        logger.info(await response.json())
-        return OutFake(**await response.json())
+        response_data = await self._post('/api/fakes/create', json={'instance_id': instance_id})
+        log_payload('create_fake', response_data)
+        return self._build(OutFake, response_data)
 
+    @invalidates(('fake', 'instance_id'))
     @retry_async(3)
     async def delete_fake(self, instance_id):
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/fakes/delete'),
-            json={'instance_id': instance_id})
+        await self._post('/api/fakes/delete', json={'instance_id': instance_id})
 
-    @retry_async(3)
+    @invalidates(('fake', 'instance_id'))
+    @retry_async(3, idempotent=False)
     async def subscribe_fake(self, instance_id: str, days: int):
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/fakes/subscribe'),
-            json={'instance_data': {'instance_id': instance_id}, 'subscribe_data': {'days': days}})
+        await self._post('/api/fakes/subscribe',
+                         json={'instance_data': {'instance_id': instance_id}, 'subscribe_data': {'days': days}})
 
+    @invalidates(('fake', 'instance_id'))
     @retry_async(3)
     async def update_fake(self, instance_id: str, username: str | None = None, description: str | None = None, **kwargs):
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/fakes/update'),
-            json={'instance_data': {'instance_id': instance_id},
-                  'update_data': {'username': username, 'description': description, 'other_data': kwargs}})
+        await self._post('/api/fakes/update',
+                         json={'instance_data': {'instance_id': instance_id},
+                               'update_data': {'username': username, 'description': description, 'other_data': kwargs}})
 
+    @cached('fake')
+    @coalesced
     @retry_async(3)
     async def get_fake(self, instance_id):
-        try:
-            response = await self._client_session.post(
-                self.base_url.format(method=f'/api/fakes/get'),
-                json={'instance_id': instance_id})
-            response_data = await response.json()
-            if not response_data:
-                return None
-            return OutFake(**response_data)
-        except ContentTypeError:
+        response_data = await self._post('/api/fakes/get', json={'instance_id': instance_id})
+        if not response_data:
             return None
+        return self._build(OutFake, response_data)
 
-    async def get_fakes(self, instance_ids: List[str]) -> List[OutFake]:
-        return [fake for fake in [await self.get_fake(instance_id) for instance_id in instance_ids] if fake is not None]
+    @with_priority(Priority.background)
+    async def get_fakes(self, instance_ids: List[str], return_exceptions: bool = False) -> List[OutFake]:
+        return await self._gather_bulk(self.get_fake, instance_ids, return_exceptions)
 
     """
     Пользователи
     """
 
-    @retry_async(3)
     async def get_subscribe_date(self, instance_id: str, action_type: ActionTypes,
                                  account_id: str | None = None) -> datetime | None:
         user = await self.get_user(instance_id)
-        for subscribe in user.subscribes:
-            logger.info('---Start Debug---')
-            logger.info(subscribe.account_id)
-            logger.info(account_id)
-            logger.info(subscribe.action_type)
-            logger.info(action_type)
-            logger.info('End debug')
-            if subscribe.account_id == account_id and subscribe.action_type == action_type:
-                return subscribe.subscribe_date
-        return None
+        if user is None:
+            return None
+        return user.get_subscribe_date(action_type, account_id)
 
-    @retry_async(3)
+    async def get_subscribe_dates(self, instance_id: str, pairs: Iterable[Tuple[str | None, ActionTypes]]
+                                  ) -> Dict[Tuple[str | None, ActionTypes], datetime | None]:
+        user = await self.get_user(instance_id)
+        if user is None:
+            return {pair: None for pair in pairs}
+        return {(account_id, action_type): user.get_subscribe_date(action_type, account_id)
+                for account_id, action_type in pairs}
+
+    @invalidates(('user', 'instance_id'))
+    @retry_async(3, idempotent=False)
     async def subscribe(self, instance_id: str, action_type: ActionTypes, days: int, account_id: str | None = None):
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/users/subscribe'),
-            json={'instance_id': instance_id, 'action_type': action_type,
-                  'days': days, 'account_id': account_id}
-        )
+        await self._post('/api/users/subscribe',
+                         json={'instance_id': instance_id, 'action_type': action_type,
+                               'days': days, 'account_id': account_id})
 
-    @retry_async(3)
+    @retry_async(3, idempotent=False)
     async def create_user(self, telegram_id: int) -> OutUser:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/users/create'),
-            json={'telegram_id': telegram_id})
-        logger.info(await response.json())
-        return OutUser(**await response.json())
+        response_data = await self._post('/api/users/create', json={'telegram_id': telegram_id})
+        log_payload('create_user', response_data)
+        return self._build(OutUser, response_data)
 
+    @coalesced
     @retry_async(3)
+    @hedged
     async def get_user_by_telegram_id(self, telegram_id: int) -> OutUser | None:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/users/get_by_telegram_id'), json={'telegram_id': telegram_id})
-        data = await response.json()
+        data = await self._post('/api/users/get_by_telegram_id', json={'telegram_id': telegram_id})
         if not data:
             return None
-        return OutUser(**data)
+        return self._build(OutUser, data)
 
+    @cached('user')
+    @coalesced
     @retry_async(3)
+    @hedged
     async def get_user(self, instance_id: str) -> OutUser:
-        try:
-            response = await self._client_session.post(
-                self.base_url.format(method=f'/api/users/get?instance_id={instance_id}'), json={'instance_id': instance_id})
-            response_data = await response.json()
-            if response_data:
-                return OutUser(**response_data)
-            else:
-                return None
-        except ContentTypeError:
+        response_data = await self._post(f'/api/users/get?instance_id={instance_id}', json={'instance_id': instance_id})
+        if response_data:
+            return self._build(OutUser, response_data)
+        else:
             return None
 
+    @with_priority(Priority.background)
+    @coalesced
     @retry_async(3)
     async def get_all(self) -> List[OutUser]:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/users/get_all'))
-        return [OutUser(**data) for data in await response.json()]
+        return await self._post('/api/users/get_all', build=partial(build_models, OutUser, trusted=self._trusted))
+
+    def iter_all(self, batch_size: int | None = None, page_size: int | None = None) -> AsyncIterator[OutUser]:
+        return self._iter_models(OutUser, '/api/users/get_all', batch_size=batch_size, page_size=page_size)
 
+    @invalidates(('user', 'instance_id'))
     @retry_async(3)
     async def delete_user(self, instance_id: str):
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/users/delete'), json={'instance_id': instance_id})
+        await self._post('/api/users/delete', json={'instance_id': instance_id})
 
     """"
     Анализ
     """
 
-    @retry_async(3)
+    @invalidates(('user', 'user_id'))
+    @retry_async(3, idempotent=False)
     async def create_analyze(self, user_id: str, username: str) -> OutAnalyze:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/analyze/create'),
-            json={'instance_data': {'username': username}, 'user_data': {'instance_id': user_id}})
-        return OutAnalyze(**await response.json())
+        response_data = await self._post('/api/analyze/create',
+                                         json={'instance_data': {'username': username},
+                                               'user_data': {'instance_id': user_id}})
+        return self._build(OutAnalyze, response_data)
 
+    @invalidates(('analyze', 'instance_id'))
     @retry_async(3)
     async def update_analyze(self, instance_id: str, key: str, values: List[str]) -> OutAnalyze:
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/analyze/update'),
-            json={'instance_data': {'instance_id': instance_id}, 'update_analyze': {'key': key,
-                                                                                    'values': values}})
-
+        await self._expire_stored_analyze(instance_id)
+        await self._post('/api/analyze/update',
+                         json={'instance_data': {'instance_id': instance_id},
+                               'update_analyze': {'key': key, 'values': values}})
+
+    @invalidates(('analyze', 'instance_id'))
+    async def update_analyze_delta(self, instance_id: str, key: str, append: Iterable[str] = (),
+                                   remove: Iterable[str] = ()):
+        """
+        Добавляет и удаляет значения ключа анализа, не пересылая весь список
+        """
+        append, remove = list(append), list(remove)
+        if not append and not remove:
+            return
+        await self._expire_stored_analyze(instance_id)
+        method = '/api/analyze/update_delta'
+        available, _ = await self._call_optional(method, {'instance_data': {'instance_id': instance_id},
+                                                           'update_analyze': {'key': key, 'append': append,
+                                                                              'remove': remove}}, write=True)
+        if available:
+            return
+        if self._cache is not None:
+            self._cache.invalidate('analyze', instance_id)
+        analyze = await self.get_analyze(instance_id)
+        values = dict.fromkeys(analyze.data.get(key, []) if analyze is not None else [])
+        for value in remove:
+            values.pop(value, None)
+        values.update(dict.fromkeys(append))
+        await self.update_analyze(instance_id, key, list(values))
+
+    async def append_analyze(self, instance_id: str, key: str, values: Iterable[str]):
+        await self.update_analyze_delta(instance_id, key, append=values)
+
+    async def remove_analyze(self, instance_id: str, key: str, values: Iterable[str]):
+        await self.update_analyze_delta(instance_id, key, remove=values)
+
+    async def sync_analyze(self, instance_id: str, key: str, previous: Iterable[str], current: Iterable[str]):
+        """
+        Отправляет только разницу между прошлым и новым списком значений ключа
+        """
+        diff = diff_values(previous, current)
+        await self.update_analyze_delta(instance_id, key, append=diff.added, remove=diff.removed)
+
+    @invalidates(('analyze', 'instance_id'))
     @retry_async(3)
     async def subscribe_analyze(self, instance_id: str):
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/analyze/subscribe'),
-            json={'instance_id': instance_id})
+        await self._expire_stored_analyze(instance_id)
+        await self._post('/api/analyze/subscribe', json={'instance_id': instance_id})
 
+    @cached('analyze')
+    @coalesced
     @retry_async(3)
     async def get_analyze(self, instance_id: str):
-        try:
-            response = await self._client_session.post(
-                self.base_url.format(method=f'/api/analyze/get'),
-                json={'instance_id': instance_id})
-            response_data = await response.json()
-            if response_data:
-                return OutAnalyze(**response_data)
-            else:
-                return None
-        except ContentTypeError:
-            return None
+        if self._analyze_store is not None:
+            stored, analyze = await self._revalidate_analyze(instance_id)
+            if analyze is None and stored is not None:
+                analyze = await self._analyze_store.load_analyze(stored)
+            return analyze
+        return await self._post('/api/analyze/get', json={'instance_id': instance_id},
+                                build=partial(build_model, OutAnalyze, trusted=self._trusted))
+
+    async def get_analyze_keys(self, instance_id: str, keys: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Только нужные ключи data; с дисковым кэшем остальные ключи не читаются и не разбираются
+        """
+        keys = list(keys)
+        if self._analyze_store is None:
+            analyze = await self.get_analyze(instance_id)
+            return {key: analyze.data[key] for key in keys if key in analyze.data} if analyze is not None else {}
+        return await self._get_stored_analyze_keys(instance_id, keys)
+
+    @retry_async(3)
+    async def _get_stored_analyze_keys(self, instance_id: str, keys: List[str]) -> Dict[str, List[str]]:
+        stored, analyze = await self._revalidate_analyze(instance_id)
+        if analyze is not None:
+            return {key: analyze.data[key] for key in keys if key in analyze.data}
+        if stored is None:
+            return {}
+        return await self._analyze_store.load(instance_id, keys)
+
+    async def _revalidate_analyze(self, instance_id: str) -> Tuple[StoredAnalyze | None, OutAnalyze | None]:
+        """
+        Сверяет снимок на диске с сервером. Возвращает запись на диске, если она актуальна,
+        или скачанный и уже сохранённый OutAnalyze
+        """
+        store = self._analyze_store
+        stored = await store.entry(instance_id)
+        if stored is not None and store.is_fresh(stored):
+            return stored, None
+        headers = {'If-None-Match': stored.etag} if stored is not None and stored.etag else None
+        status, content_type, response_headers, body = await self._request(
+            '/api/analyze/get', json={'instance_id': instance_id}, headers=headers)
+        if status == 304 and stored is not None:
+            await store.touch(instance_id, stored.etag)
+            return stored, None
+        digest = hashlib.sha1(body).hexdigest()
+        if stored is not None and digest == stored.digest:
+            # ETag сервер не поддерживает, но данные не изменились - не разбираем тело заново
+            await store.touch(instance_id, response_headers.get('ETag'))
+            return stored, None
+        data = await self._decode(content_type, body)
+        analyze = build_model(OutAnalyze, data, trusted=self._trusted)
+        if analyze is None:
+            await store.delete(instance_id)
+            return None, None
+        await store.save(instance_id, data, response_headers.get('ETag'), digest)
+        return None, analyze
+
+    async def _expire_stored_analyze(self, instance_id: str):
+        if self._analyze_store is not None:
+            await self._analyze_store.expire(instance_id)
+
+    @coalesced
+    @retry_async(3)
+    async def get_analyze_compact(self, instance_id: str) -> CompactAnalyze | None:
+        return await self._post('/api/analyze/get', json={'instance_id': instance_id}, build=build_compact_analyze)
 
     """
     Акаунты
     """
 
+    @invalidates(('account', 'instance_id'))
     @retry_async(3)
     async def update_account(self, instance_id: str, username: str | None = None, password: str | None = None,
                              description: str | None = None):
-        await self._client_session.post(self.base_url.format(method=f'/api/accounts/update'),
-                                        json={'instance_id': instance_id, 'username': username, 'password': password,
-                                              'description': description})
+        self._recipients.forget_account(instance_id)
+        await self._post('/api/accounts/update',
+                         json={'instance_id': instance_id, 'username': username, 'password': password,
+                               'description': description})
 
-    @retry_async(3)
+    @invalidates(('user', 'user_id'))
+    @retry_async(3, idempotent=False)
     async def create_account(self, user_id: str, login: str, is_fake: bool = False) -> OutAccount:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/accounts/create'),
-            json={'login': login, 'user_id': user_id, 'is_fake': is_fake})
-        return OutAccount(**await response.json())
+        response_data = await self._post('/api/accounts/create',
+                                         json={'login': login, 'user_id': user_id, 'is_fake': is_fake})
+        return self._build(OutAccount, response_data)
 
-    @retry_async(3)
+    @invalidates(('account', 'instance_id'))
+    @retry_async(3, idempotent=False)
     async def add_fake(self, instance_id: str) -> OutAccount | None:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/accounts/add_fake'),
-            json={'instance_id': instance_id})
-        try:
-            response_data = await response.json()
-        except (ContentTypeError, JSONDecodeError) as e:
-            return None
+        response_data = await self._post('/api/accounts/add_fake', json={'instance_id': instance_id})
         if not response_data:
             return None
-        return OutAccount(**response_data)
+        return self._build(OutAccount, response_data)
 
+    @invalidates(('account', 'instance_id'))
     @retry_async(3)
     async def remove_fake(self, instance_id: str, fake_id: str):
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/accounts/remove_fake'),
-            json={'instance_id': instance_id, 'fake_id': fake_id})
+        await self._post('/api/accounts/remove_fake', json={'instance_id': instance_id, 'fake_id': fake_id})
 
+    @invalidates(('account', 'instance_id'), ('user', None))
     @retry_async(3)
     async def delete_account(self, instance_id: str):
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/accounts/delete'), json={'instance_id': instance_id})
+        self._recipients.forget_account(instance_id)
+        await self._post('/api/accounts/delete', json={'instance_id': instance_id})
 
+    @cached('account')
+    @coalesced
     @retry_async(3)
+    @hedged
     async def get_account(self, instance_id: str) -> OutAccount | None:
-        try:
-            response = await self._client_session.post(
-                self.base_url.format(method=f'/api/accounts/get'), json={'instance_id': instance_id})
-            data = await response.json()
-            if not data:
-                return None
-            return OutAccount(**await response.json())
-        except ContentTypeError:
+        data = await self._post('/api/accounts/get', json={'instance_id': instance_id})
+        if not data:
             return None
+        return self._build(OutAccount, data)
 
+    @coalesced
     @retry_async(3)
     async def get_payments_method(self) -> str:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/users/get_payments'))
-        return (await response.json)['payments_id']
+        return (await self._post('/api/users/get_payments'))['payments_id']
 
+    @coalesced
     @retry_async(3)
     async def get_payments_subscribes(self) -> str:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/users/get_payments_subscribes'))
-        return await response.json()
+        return await self._post('/api/users/get_payments_subscribes')
 
     @retry_async(3)
     async def update_payments_method(self, instance_id: str, payments_id: str):
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/users/update_payments'), json={'instance_id': instance_id, 'payments_id': payments_id})
+        await self._post('/api/users/update_payments', json={'instance_id': instance_id, 'payments_id': payments_id})
 
     """
     Действия
     """
 
-    @retry_async(3)
+    @invalidates(('account', 'account_id'))
+    @retry_async(3, idempotent=False)
     async def create_action(self, account_id: str, action_type: ActionTypes,
                             data: Dict[str, str] | None = None) -> OutAction:
         if data is None:
             data = dict()
 
-        response = await self._client_session.post(
-            self.base_url.format(
-                method=f'/api/actions/create'), json={'account_id': account_id, 'action_type': action_type,
-                                                      'data': data}
-        )
-        print(await response.json())
-        return OutAction(**await response.json())
+        response_data = await self._post('/api/actions/create',
+                                         json={'account_id': account_id, 'action_type': action_type, 'data': data})
+        log_payload('create_action', response_data)
+        return self._build(OutAction, response_data)
 
+    @coalesced
     @retry_async(3)
+    @hedged
     async def get_action_queue(self, instance_id: str) -> OutAction | None:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/actions/get_queue'),
-            json={'instance_id': instance_id}
-        )
-        try:
-            data = await response.json()
-        except (JSONDecodeError, ContentTypeError):
-            return None
+        data = await self._post('/api/actions/get_queue', json={'instance_id': instance_id})
         if not data:
             return None
-        return OutAction(**data)
+        return self._build(OutAction, data)
 
+    @cached('action')
+    @coalesced
     @retry_async(3)
+    @hedged
     async def get_action(self, instance_id: str) -> OutAction:
-        try:
-            response = await self._client_session.post(
-                self.base_url.format(method=f'/api/actions/get'), json={'instance_id': instance_id}
-            )
-            response_data = await response.json()
-            if not response_data:
-                return None
-            return OutAction(**response_data)
-        except ContentTypeError:
+        response_data = await self._post('/api/actions/get', json={'instance_id': instance_id})
+        if not response_data:
             return None
+        return self._build(OutAction, response_data)
+
+    @coalesced
     @retry_async(3)
     async def get_all_action_by_account(self, instance_id: str) -> List[OutAction]:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/actions/get_all_by_account', json={'instance_id': instance_id})
-        )
-        return [OutAction(**data) for data in await response.json()]
+        return await self._post('/api/actions/get_all_by_account', json={'instance_id': instance_id},
+                                build=partial(build_models, OutAction, trusted=self._trusted))
+
+    def iter_all_action_by_account(self, instance_id: str, batch_size: int | None = None,
+                                   page_size: int | None = None) -> AsyncIterator[OutAction]:
+        return self._iter_models(OutAction, '/api/actions/get_all_by_account', json={'instance_id': instance_id},
+                                 batch_size=batch_size, page_size=page_size)
 
+    @invalidates(('action', 'instance_id'))
     @retry_async(3)
     async def set_status(self, instance_id: str, status: ActionStatuses):
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/actions/set_status'), json={'status': status, 'instance_id': instance_id}
-        )
-        logger.info(await response.json())
-        return await response.json()
+        response_data = await self._post('/api/actions/set_status', json={'status': status, 'instance_id': instance_id})
+        log_payload('set_status', response_data)
+        return response_data
 
+    @write_behind('result')
+    @invalidates(('action', 'instance_id'))
     @retry_async(3)
     async def set_result(self, instance_id: str, key: str, value: str):
-        response = await self._client_session.post(
-            self.base_url.format(
-                method=f'/api/actions/set_result'
-            ), json={'key': key, 'value': value, 'instance_id': instance_id})
-
-        return await response.json()
+        return await self._post('/api/actions/set_result', json={'key': key, 'value': value, 'instance_id': instance_id})
 
+    @reads_own_writes('result')
+    @coalesced
     @retry_async(3)
     async def get_result(self, instance_id: str, key: str):
-        response = await self._client_session.post(
-            self.base_url.format(
-                method=f'/api/actions/get_result'
-            ), json={'key': key, 'instance_id': instance_id})
-        res = await response.text()
-        return res.replace('"', '') if res != 'null' else None
+        return self._decode_value(await self._post_text('/api/actions/get_result',
+                                                        json={'key': key, 'instance_id': instance_id}))
+
+    async def get_result_many(self, instance_id: str, keys: Iterable[str]) -> Dict[str, Any]:
+        return await self._get_values_many('result', instance_id, keys, self.get_result)
 
+    @with_priority(Priority.background)
+    async def get_actions_results(self, instances_ids: List[str], keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        return await self._get_values_bulk('result', instances_ids, keys, self.get_result_many)
+
+    @discards_write('result')
+    @invalidates(('action', 'instance_id'))
     @retry_async(3)
     async def delete_result(self, instance_id: str, key: str):
-        response = await self._client_session.post(
-            self.base_url.format(
-                method=f'/api/actions/delete_result'
-            ), json={'key': key, 'instance_id': instance_id}
-        )
+        await self._post('/api/actions/delete_result', json={'key': key, 'instance_id': instance_id})
 
+    @write_behind('data')
+    @invalidates(('action', 'instance_id'))
     @retry_async(3)
     async def set_data(self, instance_id: str, key: str, value: str):
-        response = await self._client_session.post(
-            self.base_url.format(
-                method=f'/api/actions/set_data'
-            ), json={'key': key, 'value': value, 'instance_id': instance_id})
-
-        return await response.json()
+        return await self._post('/api/actions/set_data', json={'key': key, 'value': value, 'instance_id': instance_id})
 
+    @reads_own_writes('data')
+    @coalesced
     @retry_async(3)
-    async def get_data(self, instance_id: str, key: str) -> str | None:
-        response = await self._client_session.post(
-            self.base_url.format(
-                method=f'/api/actions/get_data'
-            ), json={'key': key, 'instance_id': instance_id})
+    async def get_data(self, instance_id: str, key: str) -> Any:
+        return self._decode_value(await self._post_text('/api/actions/get_data',
+                                                        json={'key': key, 'instance_id': instance_id}))
+
+    async def get_data_many(self, instance_id: str, keys: Iterable[str]) -> Dict[str, Any]:
+        return await self._get_values_many('data', instance_id, keys, self.get_data)
 
-        res = await response.text()
-        return res.replace('"', '') if res != 'null' else None
+    @with_priority(Priority.background)
+    async def get_actions_data(self, instances_ids: List[str], keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        return await self._get_values_bulk('data', instances_ids, keys, self.get_data_many)
 
+    @discards_write('data')
+    @invalidates(('action', 'instance_id'))
     @retry_async(3)
     async def delete_data(self, instance_id: str, key: str):
-        response = await self._client_session.post(
-            self.base_url.format(
-                method=f'/api/actions/delete_data'
-            ), json={'key': key, 'instance_id': instance_id}
-        )
+        await self._post('/api/actions/delete_data', json={'key': key, 'instance_id': instance_id})
 
     """
     Прокси
     """
 
-    @retry_async(3)
+    @retry_async(3, idempotent=False)
     async def create_proxy(self, host: str, port: int, username: str, password: str) -> OutProxy:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/proxy/create'), json={'host': host, 'port': port,
-                                                                     'username': username, 'password': password}
-        )
-        logger.info(await response.json())
-        return OutProxy(**await response.json())
+        response_data = await self._post('/api/proxy/create',
+                                         json={'host': host, 'port': port, 'username': username, 'password': password})
+        log_payload('create_proxy', response_data)
+        return self._build(OutProxy, response_data)
 
+    @coalesced
     @retry_async(3)
     async def get_proxy(self, instance_id: str) -> OutProxy | None:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/proxy/get'), json={'instance_id': instance_id}
-        )
-        response_data = await response.json()
+        response_data = await self._post('/api/proxy/get', json={'instance_id': instance_id})
         if not response_data:
             return None
-        return OutProxy(**await response.json())
+        return self._build(OutProxy, response_data)
 
     @retry_async(3)
     async def get_queue_proxy(self) -> OutProxy | None:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/sub_servers/get_queue')
-        )
-        if not (await response.json()):
+        response_data = await self._post('/api/sub_servers/get_queue')
+        if not response_data:
             return None
-        return OutSubServer(**await response.json())
+        return self._build(OutSubServer, response_data)
 
     """
     Сабсерверы
     """
 
-    @retry_async(3)
+    @retry_async(3, idempotent=False)
     async def create_sub_server(self, host: str, port: int) -> OutSubServer:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/sub_servers/create'), json={'host': host, 'port': port}
-        )
-        logger.info(await response.json())
-        return OutSubServer(**await response.json())
+        response_data = await self._post('/api/sub_servers/create', json={'host': host, 'port': port})
+        log_payload('create_sub_server', response_data)
+        return self._build(OutSubServer, response_data)
 
+    @coalesced
     @retry_async(3)
     async def get_sub_server(self, instance_id: str) -> OutSubServer:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/sub_servers/get'), json={'instance_id': instance_id}
-        )
-        return OutSubServer(**await response.json())
+        return self._build(OutSubServer, await self._post('/api/sub_servers/get', json={'instance_id': instance_id}))
 
     @retry_async(3)
     async def get_queue_sub_server(self) -> OutSubServer | None:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/sub_servers/get_queue')
-        )
-        if not (await response.json()):
+        response_data = await self._post('/api/sub_servers/get_queue')
+        if not response_data:
             return None
-        return OutSubServer(**await response.json())
+        return self._build(OutSubServer, response_data)
 
+    @with_priority(Priority.background)
+    @coalesced
     @retry_async(3)
     async def get_all_sub_servers(self) -> List[OutSubServer]:
-        response = await self._client_session.post(
-            self.base_url.format(method=f'/api/sub_servers/get')
-        )
-        logger.info(await response.json())
-        return [OutSubServer(**data) for data in await response.json()]
+        sub_servers = await self._post('/api/sub_servers/get',
+                                       build=partial(build_models, OutSubServer, trusted=self._trusted))
+        log_payload('get_all_sub_servers', sub_servers)
+        return sub_servers
+
+    def iter_all_sub_servers(self, batch_size: int | None = None,
+                             page_size: int | None = None) -> AsyncIterator[OutSubServer]:
+        return self._iter_models(OutSubServer, '/api/sub_servers/get', batch_size=batch_size, page_size=page_size)
 
     @retry_async(3)
     async def delete_sub_server(self, instance_id: str):
-        await self._client_session.post(
-            self.base_url.format(method=f'/api/sub_servers/delete'), json={'instance_id': instance_id}
-        )
+        await self._post('/api/sub_servers/delete', json={'instance_id': instance_id})
 
     """
     Остальное
     """
 
-    @retry_async(3)
+    def _notifications(self) -> NotificationDispatcher:
+        if self._notifier is None:
+            raise RuntimeError('Notifier is not configured')
+        return self._notifier
+
+    async def _resolve_recipient(self, account_id: str) -> Tuple[str, int]:
+        recipient = self._recipients.recipient(account_id)
+        if recipient is None:
+            account = await self.get_account(account_id)
+            user = await self.get_user(account.user_id)
+            self._recipients.remember_recipient(account_id, account.login, user.telegram_id)
+            recipient = (account.login, user.telegram_id)
+        return recipient
+
+    async def _resolve_account_id(self, action_id: str) -> str:
+        account_id = self._recipients.account_id(action_id)
+        if account_id is None:
+            action = await self.get_action(instance_id=action_id)
+            account_id = action.account_id
+            self._recipients.remember_account(action_id, account_id)
+        return account_id
+
     async def send_error(self, instance_id: str):
+        notifier = self._notifications()
+        # Статус нужен актуальный, поэтому само действие не кэшируется здесь
         action = await self.get_action(instance_id=instance_id)
-        account = await self.get_account(action.account_id)
-        user = await self.get_user(account.user_id)
+        self._recipients.remember_account(instance_id, action.account_id)
+        login, telegram_id = await self._resolve_recipient(action.account_id)
         text = ("<b>Ошибка</b>\n"
-                f"<b>Аккаунт: </b><code>{account.login}</code>\n"
+                f"<b>Аккаунт: </b><code>{login}</code>\n"
                 f"<b>Действие: </b><code>{ActionTypes.get_title(action.action_type)}</code>\n"
                 f"<b>Текущий статус: </b><code>{ActionStatuses.get_title(action.status)}</code>"
                 )
-        await self._bot.send_message(chat_id=user.telegram_id, text=text)
+        notifier.enqueue(telegram_id, text)
 
-    @retry_async(3)
     async def send_code_request(self, instance_id: str):
+        notifier = self._notifications()
         text = (f'<b>Введите код из письма</b>\n#Service info\nAction ID: {instance_id}')
-        action = await self.get_action(instance_id=instance_id)
-        account = await self.get_account(action.account_id)
-        user = await self.get_user(account.user_id)
-        await self._bot.send_message(chat_id=user.telegram_id, text=text)
+        _, telegram_id = await self._resolve_recipient(await self._resolve_account_id(instance_id))
+        notifier.enqueue(telegram_id, text)
 
-    @retry_async(3)
+    @retry_async(3, idempotent=False)
     async def send_submit_request(self, instance_id: str):
         pass
 
-    @retry_async(3)
-    async def get_accounts(self, instances_ids: List[str]) -> List[OutAccount]:
-        result = []
-        for instance_id in instances_ids:
-            account = await self.get_account(instance_id)
-            if account:
-                result.append(account)
-
-        return result
-
-    @retry_async(3)
-    async def get_actions(self, instances_ids: List[str]) -> List[OutAction]:
-        result = []
-        for instance_id in instances_ids:
-            action = await self.get_action(instance_id)
-            if action:
-                result.append(action)
+    @with_priority(Priority.background)
+    async def get_accounts(self, instances_ids: List[str], return_exceptions: bool = False) -> List[OutAccount]:
+        return await self._gather_bulk(self.get_account, instances_ids, return_exceptions)
 
-        return result
+    @with_priority(Priority.background)
+    async def get_actions(self, instances_ids: List[str], return_exceptions: bool = False) -> List[OutAction]:
+        return await self._gather_bulk(self.get_action, instances_ids, return_exceptions)
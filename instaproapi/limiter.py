@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict
+
+from .priority import Priority
+
+
+class LimiterOverloadError(Exception):
+    def __init__(self, limit: int, queue_depth: int, reason: str):
+        super().__init__(f'Request shed ({reason}): limit {limit}, queue depth {queue_depth}')
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.reason = reason
+
+
+class ConcurrencyLimiter:
+    """
+    Лимит одновременных запросов с очередями по приоритетам. Interactive обслуживаются первыми,
+    а доля reserved лимита background-запросам недоступна. Чтобы фоновая работа не стояла, при
+    конкуренции каждый (interactive_burst + 1)-й освободившийся слот достаётся background.
+    Очереди ограничены по длине и времени ожидания (для background - свои пределы),
+    сверх них - LimiterOverloadError
+    """
+
+    def __init__(self, limit: int = 50, reserved: float = 0.2, interactive_burst: int = 4,
+                 max_queue: int = 100, max_wait: float = 1.0, background_max_queue: int = 1000,
+                 background_max_wait: float = 30.0):
+        self._limit = float(limit)
+        self._reserved = reserved
+        self._interactive_burst = interactive_burst
+        self._max_queue = {Priority.interactive: max_queue, Priority.background: background_max_queue}
+        self._max_wait = {Priority.interactive: max_wait, Priority.background: background_max_wait}
+
+        self._in_flight = 0
+        self._in_flight_by: Dict[Priority, int] = dict.fromkeys(Priority, 0)
+        self._waiters: Dict[Priority, Deque[asyncio.Future]] = {priority: deque() for priority in Priority}
+        # Сколько interactive подряд обогнали ждущий background
+        self._streak = 0
+
+        self.admitted: Dict[Priority, int] = dict.fromkeys(Priority, 0)
+        self.queued: Dict[Priority, int] = dict.fromkeys(Priority, 0)
+        self.shed: Dict[Priority, int] = dict.fromkeys(Priority, 0)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def background_limit(self) -> int:
+        return max(1, self.limit - math.ceil(self.limit * self._reserved))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        stats = {'limit': self.limit, 'background_limit': self.background_limit, 'in_flight': self._in_flight,
+                 'queue_depth': self.queue_depth}
+        for priority in Priority:
+            name = priority.name
+            stats.update({f'{name}_in_flight': self._in_flight_by[priority],
+                          f'{name}_queue_depth': len(self._waiters[priority]),
+                          f'{name}_admitted': self.admitted[priority], f'{name}_queued': self.queued[priority],
+                          f'{name}_shed': self.shed[priority]})
+        return stats
+
+    def _can_admit(self, priority: Priority) -> bool:
+        if self._in_flight >= self.limit:
+            return False
+        return priority == Priority.interactive or self._in_flight_by[priority] < self.background_limit
+
+    async def acquire(self, priority: Priority = Priority.interactive):
+        waiters = self._waiters[priority]
+        if not waiters and self._can_admit(priority):
+            self._grant(priority)
+            return
+        if len(waiters) >= self._max_queue[priority]:
+            self.shed[priority] += 1
+            raise LimiterOverloadError(self.limit, self.queue_depth, f'{priority.name} queue is full')
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        self.queued[priority] += 1
+        try:
+            await asyncio.wait_for(waiter, self._max_wait[priority])
+        except asyncio.TimeoutError:
+            self.shed[priority] += 1
+            raise LimiterOverloadError(self.limit, self.queue_depth,
+                                       f'{priority.name} queue wait timed out') from None
+        except asyncio.CancelledError:
+            # Слот мог достаться нам одновременно с отменой - возвращаем его следующему
+            if waiter.done() and not waiter.cancelled():
+                self.release(priority)
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    waiters.remove(waiter)
+                except ValueError:
+                    pass
+
+    def release(self, priority: Priority = Priority.interactive, latency: float | None = None,
+                dropped: bool = False):
+        """
+        latency - время ответа без ожидания в очереди; None - запрос отменён, лимит не пересчитывается
+        """
+        self._in_flight -= 1
+        self._in_flight_by[priority] -= 1
+        if latency is not None:
+            self._adjust(latency, dropped)
+        self._wake()
+
+    def _adjust(self, latency: float, dropped: bool):
+        pass
+
+    def _grant(self, priority: Priority):
+        self._in_flight += 1
+        self._in_flight_by[priority] += 1
+        self.admitted[priority] += 1
+
+    def _first_waiter(self, priority: Priority) -> asyncio.Future | None:
+        waiters = self._waiters[priority]
+        while waiters and waiters[0].done():
+            waiters.popleft()
+        return waiters[0] if waiters else None
+
+    def _wake(self):
+        while self._in_flight < self.limit:
+            interactive = self._first_waiter(Priority.interactive)
+            background = self._first_waiter(Priority.background) if self._can_admit(Priority.background) else None
+            if interactive is not None and (background is None or self._streak < self._interactive_burst):
+                priority = Priority.interactive
+                self._streak += background is not None
+            elif background is not None:
+                priority = Priority.background
+                self._streak = 0
+            else:
+                return
+            self._grant(priority)
+            self._waiters[priority].popleft().set_result(None)
+
+
+class AdaptiveLimiter(ConcurrencyLimiter):
+    """
+    ConcurrencyLimiter с адаптивным лимитом (AIMD): каждый успешный ответ при загруженном лимите
+    добавляет 1/limit, ошибка или ответ дольше latency_tolerance * базовой задержки умножает лимит
+    на backoff_ratio. Снижение - не чаще раза на поколение запросов: ответ учитывается, только если запрос
+    ушёл после прошлого снижения, иначе он видел ещё старый лимит. Базовая задержка - минимум за последние
+    window ответов, то есть время ответа ненагруженного сервера. Остальные параметры - как у ConcurrencyLimiter
+    """
+
+    def __init__(self, initial_limit: int = 20, min_limit: int = 2, max_limit: int = 200,
+                 backoff_ratio: float = 0.9, latency_tolerance: float = 2.0, window: int = 500, **kwargs):
+        super().__init__(initial_limit, **kwargs)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._backoff_ratio = backoff_ratio
+        self._latency_tolerance = latency_tolerance
+        self._window = window
+
+        self._baseline: float | None = None
+        # Минимум копится в _next_baseline и раз в window ответов заменяет базовую, чтобы следовать за сервером
+        self._next_baseline = math.inf
+        self._samples = 0
+        self._last_decrease = 0.0
+
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {**super().stats, 'baseline': self._baseline or 0.0, 'increases': self.increases,
+                'decreases': self.decreases}
+
+    def _adjust(self, latency: float, dropped: bool):
+        overloaded = dropped or (self._baseline is not None
+                                 and latency > self._baseline * self._latency_tolerance)
+        if overloaded:
+            now = time.monotonic()
+            # Пачка одновременных медленных ответов - один сигнал перегрузки, а не десяток
+            if now - latency >= self._last_decrease:
+                self._limit = max(float(self.min_limit), self._limit * self._backoff_ratio)
+                self._last_decrease = now
+                self.decreases += 1
+        elif self._in_flight + 1 >= self._limit / 2:
+            # Растём, только если лимит действительно используется
+            self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+            self.increases += 1
+        if not dropped:
+            self._observe_baseline(latency)
+
+    def _observe_baseline(self, latency: float):
+        self._next_baseline = min(self._next_baseline, latency)
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        self._samples += 1
+        if self._samples >= self._window:
+            self._baseline = self._next_baseline
+            self._next_baseline = math.inf
+            self._samples = 0
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import bisect
+from contextvars import ContextVar
+from typing import Dict, List
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Имя метода клиента, внутри которого идёт запрос; им подписываются метрики вместо URL
+current_endpoint: ContextVar[str | None] = ContextVar('current_endpoint', default=None)
+
+
+class MetricsSink:
+    """
+    Приёмник метрик клиента. Базовый класс ничего не делает - наследники переопределяют нужные методы
+    """
+
+    def observe_request(self, endpoint: str, duration: float, request_bytes: int, response_bytes: int,
+                        error: bool):
+        pass
+
+    def observe_retry(self, endpoint: str):
+        pass
+
+    def observe_pool_wait(self, endpoint: str, duration: float):
+        pass
+
+
+class EndpointStats:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency_buckets: List[int] = [0] * (len(buckets) + 1)
+        self.latency_sum = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.pool_waits = 0
+        self.pool_wait_sum = 0.0
+
+
+class InMemoryMetrics(MetricsSink):
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS, namespace: str = 'instaproapi'):
+        self._buckets = buckets
+        self._namespace = namespace
+        self._endpoints: Dict[str, EndpointStats] = {}
+
+    def _stats(self, endpoint: str) -> EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats(self._buckets)
+        return stats
+
+    def observe_request(self, endpoint: str, duration: float, request_bytes: int, response_bytes: int,
+                        error: bool):
+        stats = self._stats(endpoint)
+        stats.requests += 1
+        stats.errors += error
+        stats.latency_buckets[bisect.bisect_left(self._buckets, duration)] += 1
+        stats.latency_sum += duration
+        stats.request_bytes += request_bytes
+        stats.response_bytes += response_bytes
+
+    def observe_retry(self, endpoint: str):
+        self._stats(endpoint).retries += 1
+
+    def observe_pool_wait(self, endpoint: str, duration: float):
+        stats = self._stats(endpoint)
+        stats.pool_waits += 1
+        stats.pool_wait_sum += duration
+
+    def quantile(self, endpoint: str, q: float) -> float | None:
+        """
+        Оценка квантиля задержки сверху - по границе бакета гистограммы
+        """
+        stats = self._endpoints.get(endpoint)
+        if stats is None or not stats.requests:
+            return None
+        rank = q * stats.requests
+        seen = 0
+        for bound, count in zip((*self._buckets, float('inf')), stats.latency_buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self) -> Dict[str, Dict[str, float | int | None]]:
+        return {endpoint: {'requests': stats.requests,
+                           'errors': stats.errors,
+                           'retries': stats.retries,
+                           'latency_sum': stats.latency_sum,
+                           'latency_p50': self.quantile(endpoint, 0.5),
+                           'latency_p99': self.quantile(endpoint, 0.99),
+                           'request_bytes': stats.request_bytes,
+                           'response_bytes': stats.response_bytes,
+                           'pool_waits': stats.pool_waits,
+                           'pool_wait_sum': stats.pool_wait_sum}
+                for endpoint, stats in self._endpoints.items()}
+
+    def render_prometheus(self) -> str:
+        ns = self._namespace
+        endpoints = sorted(self._endpoints.items())
+        lines = []
+
+        def family(name: str, kind: str, attribute: str):
+            lines.append(f'# TYPE {ns}_{name} {kind}')
+            for endpoint, stats in endpoints:
+                lines.append(f'{ns}_{name}{{endpoint="{endpoint}"}} {getattr(stats, attribute)}')
+
+        family('requests_total', 'counter', 'requests')
+        family('errors_total', 'counter', 'errors')
+        family('retries_total', 'counter', 'retries')
+        family('request_bytes_total', 'counter', 'request_bytes')
+        family('response_bytes_total', 'counter', 'response_bytes')
+
+        lines.append(f'# TYPE {ns}_request_duration_seconds histogram')
+        for endpoint, stats in endpoints:
+            label = f'endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, count in zip((*self._buckets, '+Inf'), stats.latency_buckets):
+                cumulative += count
+                lines.append(f'{ns}_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{ns}_request_duration_seconds_sum{{{label}}} {stats.latency_sum}')
+            lines.append(f'{ns}_request_duration_seconds_count{{{label}}} {stats.requests}')
+
+        lines.append(f'# TYPE {ns}_pool_wait_seconds summary')
+        for endpoint, stats in endpoints:
+            label = f'endpoint="{endpoint}"'
+            lines.append(f'{ns}_pool_wait_seconds_sum{{{label}}} {stats.pool_wait_sum}')
+            lines.append(f'{ns}_pool_wait_seconds_count{{{label}}} {stats.pool_waits}')
+        return '\n'.join(lines) + '\n'
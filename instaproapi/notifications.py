@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Tuple
+
+from loguru import logger
+
+from .campaign import TokenBucket
+
+NotificationSender = Callable[[int, str], Awaitable[Any]]
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def bot_sender(bot: Any, parse_mode: str | None = 'HTML') -> NotificationSender:
+    """
+    Отправитель поверх бота с методом send_message(chat_id=..., text=...) (aiogram и совместимые)
+    """
+
+    async def send(chat_id: int, text: str):
+        if parse_mode is None:
+            return await bot.send_message(chat_id=chat_id, text=text)
+        return await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+
+    return send
+
+
+class NotificationDispatcher:
+    """
+    Очередь уведомлений: enqueue не ждёт отправки. На чат действует свой token bucket (rate сообщений
+    в секунду), на всех - общий global_rate. Пока чат ждёт своей очереди, его сообщения копятся и уходят
+    одним сообщением через separator, не длиннее max_message_length
+    """
+
+    def __init__(self, sender: NotificationSender, rate: float = 1.0, burst: float = 3, global_rate: float = 30.0,
+                 concurrency: int = 20, max_message_length: int = TELEGRAM_MESSAGE_LIMIT,
+                 separator: str = '\n\n'):
+        self._sender = sender
+        self._rate = rate
+        self._burst = burst
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._max_message_length = max_message_length
+        self._separator = separator
+
+        self._queues: Dict[int, Deque[str]] = {}
+        self._ring: Deque[int] = deque()
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._sending: set[int] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._queued = 0
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._loop_task: asyncio.Task | None = None
+
+        self.enqueued = 0
+        self.sent = 0
+        self.messages = 0
+        self.failed = 0
+
+    @property
+    def pending(self) -> int:
+        return self._queued
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'enqueued': self.enqueued, 'sent': self.sent, 'messages': self.messages, 'failed': self.failed,
+                'pending': self._queued}
+
+    def enqueue(self, chat_id: int, text: str):
+        if self._closing:
+            raise RuntimeError('Notification dispatcher is stopping')
+        if chat_id not in self._queues:
+            self._queues[chat_id] = deque()
+            self._ring.append(chat_id)
+        self._queues[chat_id].append(text)
+        self._queued += 1
+        self.enqueued += 1
+        self._wakeup.set()
+
+    def start(self):
+        if self._loop_task is None:
+            self._closing = False
+            self._loop_task = asyncio.ensure_future(self._run())
+
+    async def stop(self, drain: bool = True):
+        self._closing = True
+        if not drain:
+            self._queues.clear()
+            self._ring.clear()
+            self._queued = 0
+        self._wakeup.set()
+        if self._loop_task is not None:
+            await self._loop_task
+            self._loop_task = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self._rate, self._burst)
+        return bucket
+
+    def _pick(self) -> Tuple[int | None, float]:
+        now = time.monotonic()
+        wait = self._global_bucket.wait_time(now)
+        if wait > 0:
+            return None, wait
+        wait = math.inf
+        for _ in range(len(self._ring)):
+            chat_id = self._ring[0]
+            self._ring.rotate(-1)
+            # Сообщения одного чата уходят строго по очереди
+            if chat_id in self._sending:
+                continue
+            bucket = self._bucket(chat_id)
+            bucket_wait = bucket.wait_time(now)
+            if bucket_wait > 0:
+                wait = min(wait, bucket_wait)
+                continue
+            bucket.take(now)
+            self._global_bucket.take(now)
+            return chat_id, 0.0
+        return None, wait
+
+    def _take_batch(self, chat_id: int) -> List[str]:
+        queue = self._queues[chat_id]
+        texts = [queue.popleft()]
+        length = len(texts[0])
+        while queue and length + len(self._separator) + len(queue[0]) <= self._max_message_length:
+            length += len(self._separator) + len(queue[0])
+            texts.append(queue.popleft())
+        if not queue:
+            del self._queues[chat_id]
+            self._ring.remove(chat_id)
+        self._queued -= len(texts)
+        return texts
+
+    async def _run(self):
+        while True:
+            await self._semaphore.acquire()
+            self._wakeup.clear()
+            chat_id, wait = self._pick()
+            if chat_id is None:
+                self._semaphore.release()
+                if self._closing and not self._queued:
+                    return
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), None if wait == math.inf else wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._sending.add(chat_id)
+            task = asyncio.ensure_future(self._send(chat_id, self._take_batch(chat_id)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, chat_id: int, texts: List[str]):
+        try:
+            await self._sender(chat_id, self._separator.join(texts))
+        except Exception as e:
+            self.failed += len(texts)
+            logger.error(f'Notification to {chat_id} failed: {e!r}')
+        else:
+            self.sent += len(texts)
+            self.messages += 1
+        finally:
+            self._sending.discard(chat_id)
+            self._semaphore.release()
+            self._wakeup.set()
+
+
+class RecipientResolver:
+    """
+    Кэш цепочки action -> account -> user для уведомлений. Связи не меняются, поэтому хранятся без TTL,
+    с вытеснением по LRU
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self._maxsize = maxsize
+        self._accounts: OrderedDict[str, str] = OrderedDict()
+        self._recipients: OrderedDict[str, Tuple[str, int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, store: OrderedDict, key: str) -> Any:
+        value = store.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        store.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _set(self, store: OrderedDict, key: str, value: Any):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self._maxsize:
+            store.popitem(last=False)
+
+    def account_id(self, action_id: str) -> str | None:
+        return self._get(self._accounts, action_id)
+
+    def remember_account(self, action_id: str, account_id: str):
+        self._set(self._accounts, action_id, account_id)
+
+    def recipient(self, account_id: str) -> Tuple[str, int] | None:
+        """
+        (login аккаунта, telegram_id владельца)
+        """
+        return self._get(self._recipients, account_id)
+
+    def remember_recipient(self, account_id: str, login: str, telegram_id: int):
+        self._set(self._recipients, account_id, (login, telegram_id))
+
+    def forget_account(self, account_id: str):
+        self._recipients.pop(account_id, None)
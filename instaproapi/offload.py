@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Type
+
+from pydantic import BaseModel
+
+from .trusted import construct_trusted
+
+
+def build_model(model: Type[BaseModel], data: Any, trusted: bool = False) -> BaseModel | None:
+    if not data:
+        return None
+    return construct_trusted(model, data) if trusted else model(**data)
+
+
+def build_models(model: Type[BaseModel], data: List[Dict[str, Any]], trusted: bool = False) -> List[BaseModel]:
+    if trusted:
+        return [construct_trusted(model, item) for item in data]
+    return [model(**item) for item in data]
+
+
+def decode_and_build(loads: Callable[[bytes], Any], body: bytes, build: Callable[[Any], Any] | None) -> Any:
+    try:
+        data = loads(body)
+    except ValueError:
+        data = None
+    return build(data) if build is not None else data
+
+
+class Offloader:
+    """
+    Разбор JSON и сборка моделей для тел больше threshold байт уходят в executor (по умолчанию - пул потоков цикла).
+    Для ProcessPoolExecutor loads и build должны быть picklable: функции уровня модуля или functools.partial от них
+    """
+
+    def __init__(self, executor: Executor | None = None, threshold: int = 256 * 1024):
+        self._executor = executor
+        self._threshold = threshold
+        self.inline = 0
+        self.offloaded = 0
+        self.offloaded_bytes = 0
+
+    async def run(self, loads: Callable[[bytes], Any], body: bytes, build: Callable[[Any], Any] | None = None) -> Any:
+        if len(body) < self._threshold:
+            self.inline += 1
+            return decode_and_build(loads, body, build)
+        self.offloaded += 1
+        self.offloaded_bytes += len(body)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, decode_and_build, loads, body, build)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'inline': self.inline, 'offloaded': self.offloaded, 'offloaded_bytes': self.offloaded_bytes}
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from functools import wraps
+
+
+class Priority(str, Enum):
+    # Запросы, которых ждёт пользователь: обработчики Telegram
+    interactive = 'INTERACTIVE'
+    # Массовые выгрузки, обходы анализа и прочая фоновая работа
+    background = 'BACKGROUND'
+
+
+_priority: ContextVar[Priority | None] = ContextVar('request_priority', default=None)
+
+
+@contextmanager
+def request_priority(priority: Priority):
+    """
+    Класс приоритета для всех запросов внутри блока, в том числе из вложенных вызовов и задач
+    """
+    token = _priority.set(priority)
+    try:
+        yield priority
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(default: Priority = Priority.interactive) -> Priority:
+    return _priority.get() or default
+
+
+def with_priority(priority: Priority):
+    """
+    Приоритет метода по умолчанию; явно заданный через request_priority снаружи важнее
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _priority.get() is not None:
+                return await func(*args, **kwargs)
+            with request_priority(priority):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
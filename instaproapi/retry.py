@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import Dict
+
+from aiohttp import ClientConnectionError, ClientConnectorError, ClientPayloadError, ClientResponseError
+
+TRANSIENT_STATUSES = frozenset({429, 502, 503, 504})
+
+_idempotency_key: ContextVar[str | None] = ContextVar('idempotency_key', default=None)
+
+
+@contextmanager
+def idempotency_key(key: str):
+    """
+    Помечает вызовы внутри блока ключом идемпотентности: он уходит в заголовок Idempotency-Key,
+    и неидемпотентные методы с ним можно повторять
+    """
+    token = _idempotency_key.set(key)
+    try:
+        yield key
+    finally:
+        _idempotency_key.reset(token)
+
+
+def current_idempotency_key() -> str | None:
+    return _idempotency_key.get()
+
+
+class ErrorKind(str, Enum):
+    # Запрос гарантированно не дошёл до сервера, повтор безопасен для любого метода
+    not_sent = 'NOT_SENT'
+    transient = 'TRANSIENT'
+    permanent = 'PERMANENT'
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f'Circuit for {endpoint} is open, retry after {retry_after:.2f}s')
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self._reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def check(self, endpoint: str):
+        state = self.state
+        if state == 'closed':
+            return
+        if state == 'half_open' and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        raise CircuitOpenError(endpoint, max(0.0, self._opened_at + self._reset_timeout - time.monotonic()))
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def release(self):
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial_in_flight or self._failures >= self._failure_threshold:
+            self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+
+class RetryBudget:
+    """
+    Повторы тратят токены, успешные запросы их пополняют: не больше ratio повторов на запрос
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self._ratio = ratio
+        self._max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    def deposit(self):
+        self._tokens = min(self._max_tokens, self._tokens + self._ratio)
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class RetryPolicy:
+    def __init__(self, base_delay: float = 0.05, max_delay: float = 2.0, budget: RetryBudget | None = None,
+                 failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(self._failure_threshold, self._reset_timeout)
+        return breaker
+
+    def classify(self, error: BaseException) -> ErrorKind:
+        if isinstance(error, ClientConnectorError):
+            return ErrorKind.not_sent
+        if isinstance(error, ClientResponseError):
+            return ErrorKind.transient if error.status in TRANSIENT_STATUSES else ErrorKind.permanent
+        if isinstance(error, (ClientConnectionError, ClientPayloadError, asyncio.TimeoutError)):
+            return ErrorKind.transient
+        return ErrorKind.permanent
+
+    def backoff(self, attempt: int) -> float:
+        # full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def should_retry(self, kind: ErrorKind, idempotent: bool) -> bool:
+        if kind == ErrorKind.permanent:
+            return False
+        if kind == ErrorKind.transient and not (idempotent or current_idempotency_key() is not None):
+            return False
+        return self.budget.withdraw()
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
@@ -1,9 +1,9 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from instaproapi.schemas.server_types import ActionTypes
 
@@ -25,3 +25,17 @@ class OutUser(BaseModel):
     subscribes: List[Subscribe] = []
     fakes: List[str] = []
     analyzes: List[str] = []
+
+    _subscribe_index: Dict[Tuple[str | None, ActionTypes], datetime] | None = PrivateAttr(default=None)
+
+    @property
+    def subscribe_index(self) -> Dict[Tuple[str | None, ActionTypes], datetime]:
+        if self._subscribe_index is None:
+            index = {}
+            for subscribe in self.subscribes:
+                index.setdefault((subscribe.account_id, ActionTypes(subscribe.action_type)), subscribe.subscribe_date)
+            self._subscribe_index = index
+        return self._subscribe_index
+
+    def get_subscribe_date(self, action_type: ActionTypes, account_id: str | None = None) -> datetime | None:
+        return self.subscribe_index.get((account_id, ActionTypes(action_type)))
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        # shield: отмена одного из ожидающих не должна отменять запрос для остальных
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+
+def coalesced(func):
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        single_flight: SingleFlight | None = self._single_flight
+        if single_flight is None:
+            return await func(self, *args, **kwargs)
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        # Поколение кэша в ключе: чтение после нашей записи (и её инвалидации) не присоединяется
+        # к запросу, начатому до неё, иначе вернёт и закэширует состояние до записи
+        cache = getattr(self, '_cache', None)
+        generation = cache.version() if cache is not None else 0
+        key = (func.__name__, generation, *tuple(bound.arguments.items())[1:])
+        try:
+            hash(key)
+        except TypeError:
+            return await func(self, *args, **kwargs)
+        return await single_flight.do(key, lambda: func(self, *args, **kwargs))
+
+    return wrapper
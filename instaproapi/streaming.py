@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import codecs
+import json
+import re
+from itertools import accumulate
+from typing import Any, AsyncIterator, List, TypeVar
+
+T = TypeVar('T')
+
+_WHITESPACE = ' \t\r\n'
+_DELIMITERS = _WHITESPACE + ',]'
+_STRING_END = re.compile(r'["\\]')
+_ESCAPES = re.compile(r'\\.', re.S)
+# Всё, кроме скобок вне строк; незакрытая строка в конце чанка оставляет свою открывающую кавычку
+_NOT_BRACKETS = re.compile(r'[^\[\]{}"]*(?:"[^"]*"[^\[\]{}"]*)*')
+_BRACKET_STEPS = {'[': 1, '{': 1, ']': -1, '}': -1}
+
+
+class JsonArrayParser:
+    """
+    Инкрементальный разбор JSON-массива верхнего уровня: элементы отдаются по мере поступления байтов.
+    Для недочитанного объекта, массива или строки глубина вложенности и состояние строки переносятся
+    между чанками, и json-декодер вызывается на элементе один раз, когда его конец уже пришёл
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        # Недочитанный хвост копится кусками, чтобы не копировать его на каждом чанке
+        self._pieces: List[str] = []
+        self._tracking = False
+        self._depth = 0
+        self._in_string = False
+        self._skip = 0
+        self._started = False
+        self._finished = False
+
+    def _close_string(self, text: str, position: int) -> int | None:
+        while True:
+            match = _STRING_END.search(text, position)
+            if match is None:
+                self._skip = max(0, position - len(text))
+                return None
+            if match.group() == '"':
+                self._in_string = False
+                return match.end()
+            # Экранированный символ пропускаем, даже если он придёт в следующем чанке
+            position = match.end() + 1
+
+    def _reaches_end(self, text: str, position: int) -> bool:
+        """
+        Заканчивается ли текущий элемент в text; если нет - обновляет глубину и состояние строки.
+        Чанк проверяется регулярками, без цикла по символам
+        """
+        if self._in_string:
+            position = self._close_string(text, position)
+            if position is None:
+                return False
+            if self._depth == 0:
+                return True
+        tail = text[position:]
+        if '\\' in tail:
+            tail = _ESCAPES.sub('', tail)
+        skeleton = _NOT_BRACKETS.sub('', tail)
+        opened = skeleton.find('"')
+        brackets = skeleton if opened < 0 else skeleton[:opened]
+        depths = list(accumulate(map(_BRACKET_STEPS.__getitem__, brackets), initial=self._depth))
+        if min(depths) <= 0:
+            return True
+        self._depth = depths[-1]
+        self._in_string = opened >= 0
+        # Внутри строки нечётное число обратных слешей в конце - следующий символ экранирован
+        self._skip = (len(tail) - len(tail.rstrip('\\'))) % 2 if self._in_string else 0
+        return False
+
+    def _hold(self, tail: str, tracking: bool):
+        self._pieces = [tail]
+        self._tracking = tracking
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        text = self._text.decode(chunk)
+        if self._pieces:
+            if self._tracking and not self._reaches_end(text, self._skip):
+                self._pieces.append(text)
+                return []
+            text = ''.join(self._pieces) + text
+            self._pieces = []
+            self._tracking = False
+        items = []
+        position = 0
+        buffer = text
+        while not self._finished:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position == len(buffer):
+                break
+            char = buffer[position]
+            if not self._started:
+                if char != '[':
+                    raise ValueError(f'Expected JSON array, got {char!r}')
+                self._started = True
+                position += 1
+                continue
+            if char == ']':
+                self._finished = True
+                position += 1
+                break
+            if char == ',':
+                position += 1
+                continue
+            try:
+                item, end = self._decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if char in '[{"':
+                    self._depth = 0 if char == '"' else 1
+                    self._in_string = char == '"'
+                    if self._reaches_end(buffer, position + 1):
+                        # Конец элемента уже в буфере, а разобрать его не удалось - JSON испорчен
+                        raise
+                    self._hold(buffer[position:], tracking=True)
+                else:
+                    self._hold(buffer[position:], tracking=False)
+                return items
+            # Число может быть ещё не дочитано: элемент принимается только вместе с разделителем после него
+            if char not in '[{"' and (end == len(buffer) or buffer[end] not in _DELIMITERS):
+                self._hold(buffer[position:], tracking=False)
+                return items
+            items.append(item)
+            position = end
+        if position < len(buffer):
+            self._hold(buffer[position:], tracking=False)
+        return items
+
+    def close(self):
+        tail = ''.join(self._pieces) + self._text.decode(b'', final=True)
+        if not self._finished or tail.strip():
+            raise ValueError('Truncated or malformed JSON array')
+
+
+async def batched(iterator: AsyncIterator[T], size: int) -> AsyncIterator[List[T]]:
+    batch = []
+    async for item in iterator:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,446 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import json
+import time
+from enum import Enum
+from functools import wraps
+from typing import Any, AsyncIterator, Callable, Dict, Mapping, Tuple
+
+from aiohttp import (ClientResponseError, ClientSession, ClientTimeout, RequestInfo, TCPConnector, TraceConfig,
+                     UnixConnector)
+from loguru import logger
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from .compression import BodyDecoder, CompressionPolicy
+from .limiter import ConcurrencyLimiter
+from .metrics import MetricsSink, current_endpoint
+from .offload import Offloader, decode_and_build
+from .priority import Priority, current_priority, request_priority
+from .retry import DEFAULT_RETRY_POLICY, TRANSIENT_STATUSES, ErrorKind, RetryPolicy, current_idempotency_key
+from .streaming import JsonArrayParser
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class JsonCodec:
+    def __init__(self, dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any]):
+        self.dumps = dumps
+        self.loads = loads
+
+    @classmethod
+    def stdlib(cls) -> JsonCodec:
+        return cls(dumps=lambda obj: json.dumps(obj, default=str).encode(), loads=json.loads)
+
+    @classmethod
+    def orjson(cls) -> JsonCodec:
+        if orjson is None:
+            raise RuntimeError('orjson is not installed')
+        return cls(dumps=orjson.dumps, loads=orjson.loads)
+
+    @classmethod
+    def default(cls) -> JsonCodec:
+        return cls.orjson() if orjson is not None else cls.stdlib()
+
+
+def log_payload(endpoint: str, data: Any):
+    # lazy: repr тела строится только если уровень DEBUG включён
+    logger.opt(lazy=True).debug('{} -> {}', lambda: endpoint, lambda: data)
+
+
+def retry_async(num_tries, idempotent: bool = True, breaker_exempt: frozenset[int] = frozenset(),
+                endpoint_arg: str | None = None):
+    """
+    breaker_exempt - коды ответа, которые не считаются отказом эндпоинта для circuit breaker
+    (например, 429 на действии одного аккаунта).
+    endpoint_arg - аргумент с путём эндпоинта для общих методов-обёрток: breaker и метрики тогда свои
+    у каждого пути, а не один на функцию
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func) if endpoint_arg is not None else None
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            policy: RetryPolicy = getattr(args[0], '_retry_policy', None) or DEFAULT_RETRY_POLICY
+            metrics: MetricsSink | None = getattr(args[0], '_metrics', None)
+            if signature is None:
+                name, breaker_key = func.__name__, func.__qualname__
+            else:
+                name = breaker_key = signature.bind(*args, **kwargs).arguments[endpoint_arg]
+            breaker = policy.breaker(breaker_key)
+            token = current_endpoint.set(name)
+            try:
+                for i in range(num_tries):
+                    breaker.check(breaker_key)
+                    try:
+                        result = await func(*args, **kwargs)
+                    except asyncio.CancelledError:
+                        breaker.release()
+                        raise
+                    except Exception as e:
+                        kind = policy.classify(e)
+                        if kind == ErrorKind.permanent or (isinstance(e, ClientResponseError)
+                                                           and e.status in breaker_exempt):
+                            breaker.record_success()
+                        else:
+                            breaker.record_failure()
+                        if i == num_tries - 1 or not policy.should_retry(kind, idempotent):
+                            logger.error(e)
+                            raise e
+                        if metrics is not None:
+                            metrics.observe_retry(name)
+                        await asyncio.sleep(policy.backoff(i))
+                    else:
+                        breaker.record_success()
+                        policy.budget.deposit()
+                        return result
+            finally:
+                current_endpoint.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+class TransportOptions:
+    """
+    Настройки пула соединений для BaseTransport.start(). unix_socket - путь к сокету вместо TCP до host:port;
+    prewarm - сколько соединений открыть заранее (запросами GET на prewarm_path);
+    drain_timeout - сколько stop() ждёт завершения начатых запросов
+    """
+
+    def __init__(self, unix_socket: str | None = None, limit: int = 50, limit_per_host: int = 0,
+                 keepalive_timeout: float | None = 15.0, force_close: bool = False, dns_ttl: int | None = 10,
+                 connect_timeout: float | None = None, read_timeout: float | None = None,
+                 total_timeout: float | None = None, prewarm: int = 0, prewarm_path: str = '/',
+                 drain_timeout: float = 10.0):
+        self.unix_socket = unix_socket
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.force_close = force_close
+        self.dns_ttl = dns_ttl
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.prewarm = prewarm
+        self.prewarm_path = prewarm_path
+        self.drain_timeout = drain_timeout
+
+    def connector(self, limit: int | None = None) -> TCPConnector | UnixConnector:
+        """
+        limit переопределяет self.limit (0 - без ограничения)
+        """
+        kwargs = {'limit': self.limit if limit is None else limit, 'limit_per_host': self.limit_per_host,
+                  'force_close': self.force_close}
+        # aiohttp не принимает keepalive_timeout вместе с force_close
+        if not self.force_close and self.keepalive_timeout is not None:
+            kwargs['keepalive_timeout'] = self.keepalive_timeout
+        if self.unix_socket is not None:
+            return UnixConnector(path=self.unix_socket, **kwargs)
+        return TCPConnector(use_dns_cache=self.dns_ttl is not None, ttl_dns_cache=self.dns_ttl, **kwargs)
+
+    def timeout(self) -> ClientTimeout | None:
+        if self.connect_timeout is None and self.read_timeout is None and self.total_timeout is None:
+            return None
+        return ClientTimeout(total=self.total_timeout, sock_connect=self.connect_timeout,
+                             sock_read=self.read_timeout)
+
+
+class BaseTransport:
+    def __init__(self, host: str, port: int, json_codec: JsonCodec | None = None,
+                 retry_policy: RetryPolicy | None = None, offloader: Offloader | None = None,
+                 metrics: MetricsSink | None = None, compression: CompressionPolicy | None = None,
+                 limiter: ConcurrencyLimiter | None = None):
+        self._host = host
+        self._port = port
+        self._client_session: ClientSession | None = None
+        self._json = json_codec or JsonCodec.default()
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._offloader = offloader
+        self._metrics = metrics
+        self._compression = compression
+        self._limiter = limiter
+        self._options = TransportOptions()
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def start(self, options: TransportOptions | None = None, **kwargs):
+        """
+        options или те же настройки именованными аргументами: start(unix_socket=..., prewarm=10)
+        """
+        self._options = options or TransportOptions(**kwargs)
+        # С адаптивным лимитом очередь одна - в limiter, пул соединений запросы не придерживает
+        connector = self._options.connector(limit=0 if self._limiter is not None else None)
+        trace_configs = []
+        if self._metrics is not None:
+            trace_config = TraceConfig()
+            trace_config.on_connection_queued_start.append(self._on_connection_queued_start)
+            trace_config.on_connection_queued_end.append(self._on_connection_queued_end)
+            trace_configs.append(trace_config)
+        # Со сжатием ответы распаковываются нашим потоковым декодером, чтобы считать байты до и после распаковки
+        session_kwargs = {}
+        if (timeout := self._options.timeout()) is not None:
+            session_kwargs['timeout'] = timeout
+        self._client_session = ClientSession(connector=connector, trace_configs=trace_configs,
+                                             auto_decompress=self._compression is None, **session_kwargs)
+        if self._options.prewarm:
+            await self._prewarm(self._options.prewarm)
+
+    async def _prewarm(self, connections: int):
+        async def touch():
+            try:
+                # Ответ дочитывается, иначе соединение не вернётся в пул
+                url = self.base_url.format(method=self._options.prewarm_path)
+                async with self._client_session.get(url) as response:
+                    await response.read()
+            except Exception as e:
+                logger.debug(f'Prewarm request failed: {e!r}')
+
+        # Запросы идут одновременно, поэтому каждый открывает своё соединение и оставляет его в пуле
+        await asyncio.gather(*[touch() for _ in range(connections)])
+
+    async def stop(self):
+        # Даём дойти уже начатым запросам, потом закрываем пул
+        try:
+            await asyncio.wait_for(self._idle.wait(), self._options.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f'Closing transport with {self._in_flight} requests in flight')
+        await self._client_session.close()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def _enter_request(self, endpoint: str, default_priority: Priority = Priority.interactive) -> Priority:
+        priority = current_priority(default_priority)
+        # Запрос считается с момента входа, а не с получения слота: stop() ждёт и тех, кто стоит в очереди лимитера
+        self._in_flight += 1
+        self._idle.clear()
+        if self._limiter is not None:
+            queued_at = time.perf_counter()
+            try:
+                await self._limiter.acquire(priority)
+            except BaseException:
+                self._request_done()
+                raise
+            if self._metrics is not None:
+                self._metrics.observe_pool_wait(endpoint, time.perf_counter() - queued_at)
+        return priority
+
+    def _request_done(self):
+        self._in_flight -= 1
+        if not self._in_flight:
+            self._idle.set()
+
+    def _exit_request(self, priority: Priority, latency: float | None, error: BaseException | None,
+                      status: int | None = None):
+        self._request_done()
+        if self._limiter is not None:
+            # 5xx без исключения (например, 500) - тоже признак перегрузки, а не успешный ответ
+            dropped = (status is not None and status >= 500
+                       or error is not None and self._retry_policy.classify(error) != ErrorKind.permanent)
+            self._limiter.release(priority, latency, dropped)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self._host}:{self._port}{{method}}'
+
+    @property
+    def metrics(self) -> MetricsSink | None:
+        return self._metrics
+
+    @property
+    def compression(self) -> CompressionPolicy | None:
+        return self._compression
+
+    @property
+    def limiter(self) -> ConcurrencyLimiter | None:
+        return self._limiter
+
+    retry_async = staticmethod(retry_async)
+
+    async def _on_connection_queued_start(self, session, context, params):
+        context.queued_at = time.perf_counter()
+
+    async def _on_connection_queued_end(self, session, context, params):
+        endpoint = (context.trace_request_ctx or {}).get('endpoint', '')
+        self._metrics.observe_pool_wait(endpoint, time.perf_counter() - context.queued_at)
+
+    def _prepare(self, json: Any = None, params: Dict[str, Any] | None = None, endpoint: str = '',
+                 path: str = '') -> Tuple[Dict[str, Any], int]:
+        """
+        Аргументы для ClientSession.post и размер тела до сжатия
+        """
+        data = None
+        headers = {}
+        if json is not None:
+            data = self._json.dumps(json)
+            headers['Content-Type'] = 'application/json'
+        raw_size = len(data) if data is not None else 0
+        if self._compression is not None:
+            headers['Accept-Encoding'] = self._compression.accept_encoding
+            if data is not None:
+                data, encoding = self._compression.compress(endpoint, path, data)
+                if encoding is not None:
+                    headers['Content-Encoding'] = encoding
+        if (key := current_idempotency_key()) is not None:
+            headers['Idempotency-Key'] = key
+        if params:
+            params = {key: value.value if isinstance(value, Enum) else value
+                      for key, value in params.items() if value is not None}
+        return {'data': data, 'params': params, 'headers': headers}, raw_size
+
+    def _observe(self, endpoint: str, started: float, request: Dict[str, Any], raw_size: int, response_bytes: int,
+                 decoded_bytes: int, error: bool):
+        request_bytes = len(request['data'] or b'')
+        if self._metrics is not None:
+            self._metrics.observe_request(endpoint, time.perf_counter() - started, request_bytes, response_bytes,
+                                          error)
+        if self._compression is not None:
+            self._compression.observe(endpoint, 'Content-Encoding' in request['headers'], raw_size, request_bytes,
+                                      response_bytes, decoded_bytes)
+
+    async def _request(self, method: str, json: Any = None, params: Dict[str, Any] | None = None,
+                       headers: Dict[str, str] | None = None) -> Tuple[int, str, Mapping[str, str], bytes]:
+        path = method.split('?', 1)[0]
+        endpoint = current_endpoint.get() or path
+        request, raw_size = self._prepare(json, params, endpoint, path)
+        if headers:
+            request['headers'].update(headers)
+        priority = await self._enter_request(endpoint)
+        started = time.perf_counter()
+        latency = None
+        failure = None
+        status = None
+        response_bytes = 0
+        body = b''
+        error = True
+        try:
+            # Тело читается целиком внутри async with, соединение сразу возвращается в пул
+            async with self._client_session.post(self.base_url.format(method=method), **request,
+                                                 trace_request_ctx={'endpoint': endpoint}) as response:
+                status = response.status
+                if response.status in TRANSIENT_STATUSES:
+                    response.raise_for_status()
+                if self._compression is None:
+                    body = await response.read()
+                    response_bytes = len(body)
+                else:
+                    decoder = BodyDecoder(response.headers.get('Content-Encoding'))
+                    chunks = []
+                    async for chunk in response.content.iter_any():
+                        response_bytes += len(chunk)
+                        chunks.append(decoder.feed(chunk))
+                    chunks.append(decoder.flush())
+                    body = b''.join(chunks)
+                error = response.status >= 400
+                latency = time.perf_counter() - started
+                return response.status, response.content_type, response.headers, body
+        except Exception as e:
+            failure = e
+            latency = time.perf_counter() - started
+            raise
+        finally:
+            self._exit_request(priority, latency, failure, status)
+            self._observe(endpoint, started, request, raw_size, response_bytes, len(body), error)
+
+    def _status_error(self, method: str, status: int, headers: Mapping[str, str]) -> ClientResponseError:
+        url = URL(self.base_url.format(method=method))
+        return ClientResponseError(RequestInfo(url, 'POST', CIMultiDictProxy(CIMultiDict()), url), (), status=status,
+                                   message=f'Unexpected status {status}', headers=CIMultiDict(headers))
+
+    async def _post_raw(self, method: str, json: Any = None, params: Dict[str, Any] | None = None) -> tuple[str, bytes]:
+        _, content_type, _, body = await self._request(method, json, params)
+        return content_type, body
+
+    async def _post(self, method: str, json: Any = None, params: Dict[str, Any] | None = None,
+                    build: Callable[[Any], Any] | None = None) -> Any:
+        content_type, body = await self._post_raw(method, json, params)
+        return await self._decode(content_type, body, build)
+
+    async def _decode(self, content_type: str, body: bytes, build: Callable[[Any], Any] | None = None) -> Any:
+        if not body or 'json' not in content_type:
+            return build(None) if build is not None else None
+        if self._offloader is not None:
+            return await self._offloader.run(self._json.loads, body, build)
+        return decode_and_build(self._json.loads, body, build)
+
+    async def _post_text(self, method: str, json: Any = None, params: Dict[str, Any] | None = None) -> str:
+        _, body = await self._post_raw(method, json, params)
+        return body.decode()
+
+    async def _post_stream(self, method: str, json: Any = None, params: Dict[str, Any] | None = None,
+                           chunk_size: int = 64 * 1024) -> AsyncIterator[Any]:
+        path = method.split('?', 1)[0]
+        endpoint = current_endpoint.get() or path
+        request, raw_size = self._prepare(json, params, endpoint, path)
+        # Потоковые выгрузки списков - фоновая работа, если вызывающий не решил иначе
+        priority = await self._enter_request(endpoint, Priority.background)
+        started = time.perf_counter()
+        latency = None
+        failure = None
+        status = None
+        response_bytes = 0
+        decoded_bytes = 0
+        error = True
+        try:
+            async with self._client_session.post(self.base_url.format(method=method), **request,
+                                                 trace_request_ctx={'endpoint': endpoint}) as response:
+                # Для лимита важна задержка сервера до заголовков, а не скорость потребителя потока
+                latency = time.perf_counter() - started
+                status = response.status
+                if response.status in TRANSIENT_STATUSES:
+                    response.raise_for_status()
+                decoder = BodyDecoder(response.headers.get('Content-Encoding') if self._compression else None)
+                parser = JsonArrayParser()
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    response_bytes += len(chunk)
+                    chunk = decoder.feed(chunk)
+                    decoded_bytes += len(chunk)
+                    for item in parser.feed(chunk):
+                        yield item
+                tail = decoder.flush()
+                decoded_bytes += len(tail)
+                for item in parser.feed(tail):
+                    yield item
+                parser.close()
+                error = response.status >= 400
+        except Exception as e:
+            failure = e
+            latency = time.perf_counter() - started
+            raise
+        finally:
+            self._exit_request(priority, latency, failure, status)
+            self._observe(endpoint, started, request, raw_size, response_bytes, decoded_bytes, error)
+
+    async def _iter_list(self, method: str, json: Dict[str, Any] | None = None,
+                         page_size: int | None = None) -> AsyncIterator[Any]:
+        if page_size is None:
+            async for item in self._post_stream(method, json=json):
+                yield item
+            return
+        # Курсорная пагинация: {'cursor', 'limit'} -> {'items': [...], 'next_cursor': ...}
+        cursor = None
+        while True:
+            # Страницы - фоновая работа, как и потоковая выгрузка; контекст ставится только на время запроса,
+            # чтобы не протечь к вызывающему между yield
+            with request_priority(current_priority(Priority.background)):
+                page = await self._post(method, json={**(json or {}), 'cursor': cursor, 'limit': page_size})
+            if isinstance(page, list):
+                # Бэкенд не поддерживает пагинацию и вернул весь список
+                for item in page:
+                    yield item
+                return
+            for item in page['items']:
+                yield item
+            cursor = page.get('next_cursor')
+            if not cursor:
+                return
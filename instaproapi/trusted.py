@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Dict, Type
+
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_DICT, SHAPE_LIST, SHAPE_MAPPING, SHAPE_SINGLETON
+
+_PLANS: Dict[Type[BaseModel], Dict[str, Callable[[Any], Any] | None]] = {}
+
+
+def _parse_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        # Как pydantic: числовая метка - UTC, а не локальное время процесса
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    return datetime.fromisoformat(value)
+
+
+def _scalar_converter(type_: Any) -> Callable[[Any], Any] | None:
+    if isinstance(type_, type):
+        if issubclass(type_, Enum):
+            return type_
+        if issubclass(type_, datetime):
+            return _parse_datetime
+        if issubclass(type_, BaseModel):
+            return lambda value: construct_trusted(type_, value)
+    return None
+
+
+def _plan(model: Type[BaseModel]) -> Dict[str, Callable[[Any], Any] | None]:
+    if model in _PLANS:
+        return _PLANS[model]
+    plan = {}
+    for name, field in model.__fields__.items():
+        convert = _scalar_converter(field.type_)
+        if convert is None or field.shape == SHAPE_SINGLETON:
+            plan[name] = convert
+        elif field.shape == SHAPE_LIST:
+            plan[name] = lambda values, convert=convert: [convert(value) for value in values]
+        elif field.shape in (SHAPE_DICT, SHAPE_MAPPING):
+            plan[name] = lambda values, convert=convert: {key: convert(value) for key, value in values.items()}
+        else:
+            # Редкие формы полей (tuple, set...) проще отдать полной валидации
+            plan = None
+            break
+    _PLANS[model] = plan
+    return plan
+
+
+def construct_trusted(model: Type[BaseModel], data: Dict[str, Any]) -> BaseModel:
+    """
+    Сборка модели из ответа собственного бэкенда без полной валидации pydantic.
+    Приводятся только enum, datetime и вложенные модели, остальные значения берутся как есть
+    """
+    plan = _plan(model)
+    if plan is None:
+        return model(**data)
+    values = {}
+    for name, value in data.items():
+        if name not in plan:
+            continue
+        convert = plan[name]
+        values[name] = convert(value) if convert is not None and value is not None else value
+    return model.construct(**values)
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Set
+
+from loguru import logger
+
+from .insta_pro_api import InstaproAPI
+from .schemas.action import OutAction
+from .schemas.server_types import ActionStatuses, ActionTypes
+
+ActionHandler = Callable[[OutAction], Awaitable[ActionStatuses | None]]
+
+
+class ActionWorkerPool:
+    """
+    Пул обработчиков очереди действий сабсервера.
+    Опрос get_action_queue адаптивный: при пустой очереди интервал растёт до max_poll, при непустой действия
+    забираются подряд, пока не заполнится буфер prefetch (он же даёт backpressure). Статусы копятся и
+    отправляются пачками раз в status_flush_interval
+    """
+
+    def __init__(self, api: InstaproAPI, sub_server_id: str, handlers: Dict[ActionTypes, ActionHandler],
+                 concurrency: int = 10, type_concurrency: Dict[ActionTypes, int] | None = None, prefetch: int = 10,
+                 min_poll: float = 0.05, max_poll: float = 5.0, status_flush_interval: float = 0.5,
+                 status_batch_size: int = 50):
+        self._api = api
+        self._sub_server_id = sub_server_id
+        self._handlers = handlers
+        self._concurrency = concurrency
+        self._type_semaphores = {action_type: asyncio.Semaphore(limit)
+                                 for action_type, limit in (type_concurrency or {}).items()}
+        self._buffer: asyncio.Queue[OutAction] = asyncio.Queue(maxsize=prefetch)
+        self._min_poll = min_poll
+        self._max_poll = max_poll
+        self._status_flush_interval = status_flush_interval
+        self._status_batch_size = status_batch_size
+
+        self._leased: Set[str] = set()
+        self._statuses: Dict[str, ActionStatuses] = {}
+        self._statuses_ready = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._closing = False
+        self._poller: asyncio.Task | None = None
+        self._workers: list[asyncio.Task] = []
+        self._flusher: asyncio.Task | None = None
+
+        self.polls = 0
+        self.empty_polls = 0
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'polls': self.polls, 'empty_polls': self.empty_polls, 'processed': self.processed,
+                'failed': self.failed, 'buffered': self._buffer.qsize(), 'leased': len(self._leased),
+                'pending_statuses': len(self._statuses)}
+
+    def start(self):
+        self._poller = asyncio.ensure_future(self._poll())
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self._concurrency)]
+        self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    async def stop(self, timeout: float | None = 30.0):
+        self._stopping.set()
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+        # Дорабатываем уже взятые действия, затем останавливаем обработчиков
+        try:
+            await asyncio.wait_for(self._buffer.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f'ActionWorkerPool stopped with {len(self._leased)} unfinished actions')
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if self._flusher is not None:
+            # Текущую отправку статусов не отменяем: она уже забрала их из _statuses
+            self._closing = True
+            self._statuses_ready.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush_statuses()
+
+    async def _poll(self):
+        delay = self._min_poll
+        while not self._stopping.is_set():
+            self.polls += 1
+            try:
+                action = await self._api.get_action_queue(self._sub_server_id)
+            except Exception as e:
+                logger.error(f'get_action_queue({self._sub_server_id}) failed: {e!r}')
+                action = None
+            # Действие, которое мы уже обрабатываем, считается пустым ответом
+            if action is None or action.id in self._leased:
+                self.empty_polls += 1
+                await asyncio.sleep(delay)
+                delay = min(self._max_poll, delay * 2)
+                continue
+            delay = self._min_poll
+            self._leased.add(action.id)
+            await self._buffer.put(action)
+
+    async def _work(self):
+        while True:
+            action = await self._buffer.get()
+            try:
+                await self._handle(action)
+            finally:
+                # Аренда снимается в flush_statuses: пока итоговый статус не ушёл, сервер может вернуть
+                # это действие из get_action_queue ещё раз
+                self._buffer.task_done()
+
+    async def _handle(self, action: OutAction):
+        handler = self._handlers.get(action.action_type)
+        if handler is None:
+            logger.error(f'No handler for {action.action_type} (action {action.id})')
+            self._set_status(action.id, ActionStatuses.failed)
+            self.failed += 1
+            return
+        semaphore = self._type_semaphores.get(action.action_type)
+        try:
+            if semaphore is not None:
+                async with semaphore:
+                    status = await handler(action)
+            else:
+                status = await handler(action)
+        except Exception as e:
+            logger.error(f'Action {action.id} ({action.action_type}) failed: {e!r}')
+            self._set_status(action.id, ActionStatuses.failed)
+            self.failed += 1
+            return
+        self._set_status(action.id, status or ActionStatuses.completed)
+        self.processed += 1
+
+    def _set_status(self, instance_id: str, status: ActionStatuses):
+        self._statuses[instance_id] = status
+        if len(self._statuses) >= self._status_batch_size:
+            self._statuses_ready.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._statuses_ready.wait(), self._status_flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush_statuses()
+            if self._closing:
+                return
+
+    async def flush_statuses(self):
+        self._statuses_ready.clear()
+        if not self._statuses:
+            return
+        statuses, self._statuses = self._statuses, {}
+        try:
+            results = await asyncio.gather(*[self._api.set_status(instance_id, status)
+                                             for instance_id, status in statuses.items()], return_exceptions=True)
+        except asyncio.CancelledError:
+            # Неизвестно, какие статусы дошли; повторная отправка безопасна, потеря - нет
+            for instance_id, status in statuses.items():
+                self._statuses.setdefault(instance_id, status)
+            raise
+        for (instance_id, status), result in zip(statuses.items(), results):
+            if isinstance(result, Exception):
+                logger.error(f'set_status({instance_id}, {status}) failed: {result!r}')
+                # Не затираем более свежий статус, если он появился за время отправки
+                self._statuses.setdefault(instance_id, status)
+            elif instance_id not in self._statuses:
+                self._leased.discard(instance_id)
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from loguru import logger
+
+WriteKey = Tuple[str, str, str]
+Sender = Callable[[str, str, Any], Awaitable[Any]]
+
+
+class WriteBehindBuffer:
+    """
+    Отложенная запись set_data/set_result: повторные записи одного (instance_id, key) сливаются в последнюю,
+    буфер сбрасывается раз в flush_interval, при max_pending ключей, по flush() и при остановке клиента
+    """
+
+    def __init__(self, flush_interval: float = 0.5, max_pending: int = 100, concurrency: int = 10):
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: Dict[WriteKey, Tuple[Any, Sender]] = {}
+        # Записи текущего сброса: пока запрос не завершён, читаем их из буфера
+        self._inflight: Dict[WriteKey, Tuple[Any, Sender]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+        self.writes = 0
+        self.merged = 0
+        self.flushed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'writes': self.writes, 'merged': self.merged, 'flushed': self.flushed, 'failed': self.failed,
+                'pending': len(self._pending)}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # Текущий сброс не отменяем, а даём ему дойти: отменённые запросы потеряли бы записи
+        self._closing = True
+        self._ready.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._closing = False
+        await self.flush()
+        if self._pending:
+            logger.warning(f'Write-behind buffer stopped with {len(self._pending)} unsent writes')
+
+    def put(self, kind: str, instance_id: str, key: str, value: Any, send: Sender):
+        write_key = (kind, instance_id, key)
+        self.writes += 1
+        self.merged += write_key in self._pending
+        self._pending[write_key] = (value, send)
+        if len(self._pending) >= self._max_pending:
+            self._ready.set()
+
+    def lookup(self, kind: str, instance_id: str, key: str) -> Tuple[bool, Any]:
+        write_key = (kind, instance_id, key)
+        entry = self._pending.get(write_key) or self._inflight.get(write_key)
+        if entry is None:
+            return False, None
+        return True, entry[0]
+
+    async def discard(self, kind: str, instance_id: str, key: str):
+        self._pending.pop((kind, instance_id, key), None)
+        # Удаление не должно обогнать уже отправляемую запись того же ключа
+        if (kind, instance_id, key) in self._inflight:
+            async with self._flush_lock:
+                self._pending.pop((kind, instance_id, key), None)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+            if self._closing:
+                return
+
+    async def flush(self):
+        async with self._flush_lock:
+            self._ready.clear()
+            if not self._pending:
+                return
+            self._inflight, self._pending = self._pending, {}
+            try:
+                await asyncio.gather(*[self._send(write_key, value, send)
+                                       for write_key, (value, send) in self._inflight.items()])
+            finally:
+                self._inflight = {}
+
+    async def _send(self, write_key: WriteKey, value: Any, send: Sender):
+        kind, instance_id, key = write_key
+        async with self._semaphore:
+            try:
+                await send(instance_id, key, value)
+            except asyncio.CancelledError:
+                self._pending.setdefault(write_key, (value, send))
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f'Write-behind set_{kind}({instance_id}, {key}) failed: {e!r}')
+                # Вернём запись в буфер, если её не перезаписали за время отправки
+                self._pending.setdefault(write_key, (value, send))
+                return
+        self.flushed += 1
+
+
+def write_behind(kind: str):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, instance_id: str, key: str, value: Any):
+            buffer: WriteBehindBuffer | None = self._write_behind
+            if buffer is None or not buffer.running:
+                return await func(self, instance_id, key, value)
+            buffer.put(kind, instance_id, key, value, lambda *args: func(self, *args))
+
+        return wrapper
+
+    return decorator
+
+
+def reads_own_writes(kind: str):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, instance_id: str, key: str):
+            buffer: WriteBehindBuffer | None = self._write_behind
+            if buffer is not None:
+                found, value = buffer.lookup(kind, instance_id, key)
+                if found:
+                    return value
+            return await func(self, instance_id, key)
+
+        return wrapper
+
+    return decorator
+
+
+def discards_write(kind: str):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, instance_id: str, key: str):
+            buffer: WriteBehindBuffer | None = self._write_behind
+            if buffer is not None:
+                await buffer.discard(kind, instance_id, key)
+            return await func(self, instance_id, key)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from instaproapi.cache import EntityCache
+from instaproapi.insta_pro_api import InstaproAPI
+from instaproapi.schemas.server_types import ActionStatuses
+
+
+class Backend:
+    """
+    Бэкенд действий; get можно задержать, чтобы запись пришлась на время чтения
+    """
+
+    def __init__(self):
+        self.status = ActionStatuses.waiting
+        self.gets = 0
+        self.hold = asyncio.Event()
+        self.hold.set()
+
+    async def get_action(self, request: web.Request):
+        self.gets += 1
+        status = self.status
+        await self.hold.wait()
+        return web.json_response({'id': 'a', 'action_type': 'WATCH_STORIES', 'status': status,
+                                  'account_id': 'acc', 'update_id': 'u', 'result': None})
+
+    async def set_status(self, request: web.Request):
+        self.status = (await request.json())['status']
+        return web.json_response({'status': 'ok'})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/api/actions/get', self.get_action)
+        app.router.add_post('/api/actions/set_status', self.set_status)
+        return app
+
+
+def run(backend: Backend, scenario):
+    async def main():
+        server = TestServer(backend.app())
+        await server.start_server()
+        api = InstaproAPI(server.host, server.port, cache=EntityCache(default_ttl=60))
+        await api.start()
+        try:
+            return await scenario(api)
+        finally:
+            await api.stop()
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_read_after_own_write_does_not_join_older_request():
+    backend = Backend()
+
+    async def scenario(api: InstaproAPI):
+        backend.hold.clear()
+        before = asyncio.ensure_future(api.get_action('a'))
+        while not backend.gets:
+            await asyncio.sleep(0.01)
+        await api.set_status('a', ActionStatuses.completed)
+        after = asyncio.ensure_future(api.get_action('a'))
+        await asyncio.sleep(0.05)
+        backend.hold.set()
+        return (await before).status, (await after).status, (await api.get_action('a')).status
+
+    before, after, cached = run(backend, scenario)
+    assert before == ActionStatuses.waiting
+    assert after == ActionStatuses.completed
+    assert cached == ActionStatuses.completed
+    assert backend.gets == 2
+
+
+def test_read_started_before_invalidation_is_not_cached():
+    cache = EntityCache(default_ttl=60)
+    version = cache.version()
+    cache.invalidate('user', 'u1')
+    cache.set('user', 'u1', 'stale', version)
+    assert cache.get('user', 'u1') == (False, None)
+    cache.set('user', 'u1', 'fresh', cache.version())
+    assert cache.get('user', 'u1') == (True, 'fresh')
+
+
+def test_entity_invalidation_rejects_older_reads_of_every_key():
+    cache = EntityCache(default_ttl=60)
+    version = cache.version()
+    cache.invalidate('user')
+    cache.set('user', 'u1', 'stale', version)
+    assert cache.get('user', 'u1') == (False, None)
+    cache.set('account', 'a1', 'other entity', version)
+    assert cache.get('account', 'a1') == (True, 'other entity')
+
+
+def test_invalidation_versions_are_bounded():
+    cache = EntityCache(default_ttl=60, maxsize=4)
+    version = cache.version()
+    for index in range(100):
+        cache.invalidate('user', index)
+    assert len(cache._versions) == 4
+    # Версия вытесненного ключа забыта, но старое чтение всё равно не пишет в кэш
+    cache.set('user', 0, 'stale', version)
+    assert cache.get('user', 0) == (False, None)
+    cache.set('user', 0, 'fresh', cache.version())
+    assert cache.get('user', 0) == (True, 'fresh')
+
+
+def test_expired_entry_is_a_miss():
+    cache = EntityCache(ttl={'user': 0.01}, default_ttl=60)
+    cache.set('user', 'u1', 'value')
+    cache.set('account', 'a1', 'value')
+    time.sleep(0.02)
+    assert cache.get('user', 'u1') == (False, None)
+    assert cache.get('account', 'a1') == (True, 'value')
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EntityCache(default_ttl=60, maxsize=2)
+    cache.set('account', 0, 0)
+    cache.set('account', 1, 1)
+    cache.get('account', 0)
+    cache.set('account', 2, 2)
+    assert cache.get('account', 1) == (False, None)
+    assert cache.get('account', 0) == (True, 0)
+    assert cache.stats['size'] == 2
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from aiohttp import ClientResponseError
+
+from instaproapi.fake_pool import FakeAPIPool
+from instaproapi.schemas.account import OutAccount
+from instaproapi.schemas.fake import InstanceTypes
+from instaproapi.schemas.sub_server import OutSubServer
+
+
+class DirectoryAPI:
+    """
+    Каталог сабсерверов и аккаунтов вместо InstaproAPI: все аккаунты на сабсервере s1
+    """
+
+    async def get_all_sub_servers(self):
+        return [OutSubServer(id=sub_server_id, host='127.0.0.1', port=port)
+                for sub_server_id, port in (('s1', 1), ('s2', 2))]
+
+    async def get_account(self, account_id: str):
+        return OutAccount(login=account_id, sub_server_id='s1', user_id='user', id=account_id)
+
+
+class ThrottlingFakeAPI:
+    """
+    FakeAPI, который отвечает 429 на like заданных аккаунтов
+    """
+
+    limiter = None
+
+    def __init__(self, host: str, port: int, throttled: set):
+        self.throttled = throttled
+
+    async def start(self, options=None):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def like(self, account_id: str, instance: str, instance_type, **kwargs):
+        if account_id in self.throttled:
+            raise ClientResponseError(None, (), status=429, message='Too Many Requests')
+        return {'status': 'ok'}
+
+
+def test_account_throttling_does_not_eject_host():
+    throttled = {'acc1', 'acc2', 'acc3', 'acc4'}
+
+    async def main():
+        pool = FakeAPIPool(DirectoryAPI(), failure_threshold=3,
+                           fake_api_factory=lambda host, port: ThrottlingFakeAPI(host, port, throttled))
+        await pool.refresh()
+        for account_id in sorted(throttled):
+            with pytest.raises(ClientResponseError):
+                await pool.like(account_id, 'instance', InstanceTypes.user)
+        host = await pool.pick('healthy')
+        await pool.stop()
+        return host.id
+
+    # Аккаунт остаётся на своём сабсервере: хост не исключён из-за чужих 429
+    assert asyncio.run(main()) == 's1'
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from instaproapi.insta_pro_api import InstaproAPI
+from instaproapi.limiter import AdaptiveLimiter, ConcurrencyLimiter, LimiterOverloadError
+from instaproapi.priority import Priority, request_priority
+
+
+def test_burst_of_slow_responses_decreases_limit_once():
+    async def main():
+        limiter = AdaptiveLimiter(initial_limit=50)
+        for _ in range(10):
+            await limiter.acquire()
+            limiter.release(latency=0.01)
+        await asyncio.sleep(0.02)
+        for _ in range(50):
+            await limiter.acquire()
+        await asyncio.sleep(0.05)
+        # Все 50 ушли до снижения: это одна перегрузка, а не пятьдесят
+        for _ in range(50):
+            limiter.release(latency=0.05)
+        burst = limiter.limit, limiter.decreases
+        for _ in range(10):
+            await limiter.acquire()
+        await asyncio.sleep(0.05)
+        for _ in range(10):
+            limiter.release(latency=0.05)
+        return burst, (limiter.limit, limiter.decreases)
+
+    burst, next_generation = asyncio.run(main())
+    assert burst == (45, 1)
+    assert next_generation == (40, 2)
+
+
+def test_server_error_without_exception_counts_as_drop():
+    async def server_error(request: web.Request):
+        return web.json_response({'detail': 'Internal Server Error'}, status=500)
+
+    async def main():
+        app = web.Application()
+        app.router.add_post('/api/broken', server_error)
+        server = TestServer(app)
+        await server.start_server()
+        limiter = AdaptiveLimiter(initial_limit=10)
+        api = InstaproAPI(server.host, server.port, limiter=limiter)
+        await api.start()
+        try:
+            await api._post('/api/broken')
+        finally:
+            await api.stop()
+            await server.close()
+        return limiter
+
+    limiter = asyncio.run(main())
+    assert limiter.decreases == 1
+    assert limiter.increases == 0
+    assert limiter.limit == 9
+
+
+def test_background_cannot_take_reserved_share():
+    async def main():
+        limiter = ConcurrencyLimiter(limit=10, reserved=0.2, max_wait=0.05, background_max_wait=0.05)
+        for _ in range(limiter.background_limit):
+            await limiter.acquire(Priority.background)
+        with pytest.raises(LimiterOverloadError):
+            await limiter.acquire(Priority.background)
+        for _ in range(10 - limiter.background_limit):
+            await limiter.acquire(Priority.interactive)
+        return limiter.stats
+
+    stats = asyncio.run(main())
+    assert stats['background_in_flight'] == 8
+    assert stats['interactive_in_flight'] == 2
+    assert stats['background_shed'] == 1
+
+
+def test_interactive_goes_first_but_background_is_not_starved():
+    async def main():
+        limiter = ConcurrencyLimiter(limit=1, interactive_burst=2)
+        await limiter.acquire(Priority.interactive)
+        order = []
+
+        async def request(priority: Priority, name: str):
+            await limiter.acquire(priority)
+            order.append(name)
+            limiter.release(priority)
+
+        waiters = [asyncio.ensure_future(request(Priority.background, f'b{index}')) for index in range(2)]
+        waiters += [asyncio.ensure_future(request(Priority.interactive, f'i{index}')) for index in range(4)]
+        await asyncio.sleep(0)
+        limiter.release(Priority.interactive)
+        await asyncio.gather(*waiters)
+        return order
+
+    assert asyncio.run(main()) == ['i0', 'i1', 'b0', 'i2', 'i3', 'b1']
+
+
+def test_full_queue_sheds_requests():
+    async def main():
+        limiter = ConcurrencyLimiter(limit=1, max_queue=1)
+        await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(LimiterOverloadError):
+            await limiter.acquire()
+        limiter.release()
+        await queued
+        return limiter.stats
+
+    stats = asyncio.run(main())
+    assert stats['interactive_shed'] == 1
+    assert stats['interactive_admitted'] == 2
+
+
+def test_paginated_pages_run_at_background_priority():
+    pages = {None: {'items': [1, 2], 'next_cursor': 'c'}, 'c': {'items': [3], 'next_cursor': None}}
+
+    async def page(request: web.Request):
+        return web.json_response(pages[(await request.json())['cursor']])
+
+    async def main():
+        app = web.Application()
+        app.router.add_post('/api/users/get_all', page)
+        server = TestServer(app)
+        await server.start_server()
+        limiter = ConcurrencyLimiter(limit=10)
+        api = InstaproAPI(server.host, server.port, limiter=limiter)
+        await api.start()
+        try:
+            items = [item async for item in api._iter_list('/api/users/get_all', page_size=2)]
+            with request_priority(Priority.interactive):
+                async for _ in api._iter_list('/api/users/get_all', page_size=2):
+                    pass
+        finally:
+            await api.stop()
+            await server.close()
+        return items, limiter.admitted
+
+    items, admitted = asyncio.run(main())
+    assert items == [1, 2, 3]
+    assert admitted == {Priority.background: 2, Priority.interactive: 2}
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+from aiohttp import ClientResponseError, web
+from aiohttp.test_utils import TestServer
+
+from instaproapi.insta_pro_api import InstaproAPI
+from instaproapi.retry import CircuitOpenError, RetryPolicy
+
+
+class Backend:
+    """
+    Бэкенд без необязательных эндпоинтов: на неизвестный путь отвечает JSON-404, как FastAPI
+    """
+
+    def __init__(self, missing_status: int = 404):
+        self.missing_status = missing_status
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.analyze = {'id': 'an', 'username': 'username', 'user_id': 'user_0', 'is_subscribe': True,
+                        'data': {'followers': ['u1', 'u2']}}
+        self.values = {'data': {'a': '1', 'b': '"two"'}, 'result': {'a': '3'}}
+
+    @web.middleware
+    async def not_found(self, request: web.Request, handler):
+        self.calls.append(request.path)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            return await handler(request)
+        except web.HTTPNotFound:
+            return web.json_response({'detail': 'Not Found'}, status=self.missing_status)
+        finally:
+            self.active -= 1
+
+    async def get_analyze(self, request: web.Request):
+        return web.json_response(self.analyze)
+
+    async def update_analyze(self, request: web.Request):
+        body = await request.json()
+        self.analyze['data'][body['update_analyze']['key']] = body['update_analyze']['values']
+        return web.json_response(None)
+
+    def value_handler(self, kind: str):
+        async def handler(request: web.Request):
+            body = await request.json()
+            return web.Response(text=self.values[kind].get(body['key'], 'null'))
+
+        return handler
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.not_found])
+        app.router.add_post('/api/analyze/get', self.get_analyze)
+        app.router.add_post('/api/analyze/update', self.update_analyze)
+        app.router.add_post('/api/actions/get_data', self.value_handler('data'))
+        app.router.add_post('/api/actions/get_result', self.value_handler('result'))
+        return app
+
+
+def with_routes(backend: Backend, **routes):
+    app = backend.app
+
+    def app_with_routes():
+        application = app()
+        for path, handler in routes.items():
+            application.router.add_post(f'/api/{path}', handler)
+        return application
+
+    backend.app = app_with_routes
+
+
+def run(backend: Backend, scenario, **api_kwargs):
+    async def main():
+        server = TestServer(backend.app())
+        await server.start_server()
+        api = InstaproAPI(server.host, server.port, **api_kwargs)
+        await api.start()
+        try:
+            return await scenario(api)
+        finally:
+            await api.stop()
+            await server.close()
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('status', [404, 405, 501])
+def test_update_analyze_delta_falls_back_when_endpoint_is_missing(status):
+    backend = Backend(status)
+
+    async def scenario(api: InstaproAPI):
+        await api.append_analyze('an', 'followers', ['u3'])
+        await api.remove_analyze('an', 'followers', ['u1'])
+        return api._optional_endpoints
+
+    optional_endpoints = run(backend, scenario)
+    assert backend.analyze['data']['followers'] == ['u2', 'u3']
+    assert backend.calls.count('/api/analyze/update_delta') == 1
+    assert optional_endpoints['/api/analyze/update_delta'] is False
+
+
+def test_update_analyze_delta_raises_on_server_error():
+    backend = Backend(400)
+
+    async def scenario(api: InstaproAPI):
+        with pytest.raises(ClientResponseError):
+            await api.append_analyze('an', 'followers', ['u3'])
+        return api._optional_endpoints
+
+    assert '/api/analyze/update_delta' not in run(backend, scenario)
+    assert '/api/analyze/update' not in backend.calls
+
+
+def test_get_values_many_falls_back_when_endpoint_is_missing():
+    backend = Backend()
+
+    async def scenario(api: InstaproAPI):
+        first = await api.get_data_many('act', ['a', 'b', 'c'])
+        second = await api.get_result_many('act', ['a'])
+        return first, second, api._optional_endpoints
+
+    first, second, optional_endpoints = run(backend, scenario)
+    assert first == {'a': 1, 'b': 'two', 'c': None}
+    assert second == {'a': 3}
+    assert optional_endpoints['/api/actions/get_data_many'] is False
+    assert optional_endpoints['/api/actions/get_result_many'] is False
+
+
+def test_get_values_bulk_falls_back_when_endpoints_are_missing():
+    backend = Backend()
+
+    async def scenario(api: InstaproAPI):
+        return await api.get_actions_data(['act1', 'act2'], ['a', 'b'])
+
+    assert run(backend, scenario) == {'act1': {'a': 1, 'b': 'two'}, 'act2': {'a': 1, 'b': 'two'}}
+    assert backend.calls.count('/api/actions/get_data_bulk') == 1
+    assert '/api/actions/get_data' in backend.calls
+
+
+def test_get_values_many_uses_batch_endpoint():
+    backend = Backend()
+
+    async def get_data_many(request):
+        body = await request.json()
+        return web.json_response({key: json.loads(backend.values['data'].get(key, 'null')) for key in body['keys']})
+
+    with_routes(backend, **{'actions/get_data_many': get_data_many})
+
+    async def scenario(api: InstaproAPI):
+        return await api.get_data_many('act', ['a', 'b']), api._optional_endpoints
+
+    values, optional_endpoints = run(backend, scenario)
+    assert values == {'a': 1, 'b': 'two'}
+    assert optional_endpoints['/api/actions/get_data_many'] is True
+    assert '/api/actions/get_data' not in backend.calls
+
+
+def test_get_values_bulk_probes_missing_endpoint_once():
+    backend = Backend()
+    instances_ids = [f'act{index}' for index in range(50)]
+
+    async def scenario(api: InstaproAPI):
+        return await api.get_actions_data(instances_ids, ['a'])
+
+    values = run(backend, scenario, bulk_concurrency=5)
+    assert values == {instance_id: {'a': 1} for instance_id in instances_ids}
+    assert backend.calls.count('/api/actions/get_data_bulk') == 1
+    assert backend.calls.count('/api/actions/get_data_many') == 1
+    assert backend.calls.count('/api/actions/get_data') == 50
+    assert backend.max_active <= 5
+
+
+def test_update_analyze_delta_accepts_empty_success_body():
+    backend = Backend()
+
+    async def update_delta(request):
+        body = await request.json()
+        backend.analyze['data'][body['update_analyze']['key']].extend(body['update_analyze']['append'])
+        return web.json_response(None)
+
+    with_routes(backend, **{'analyze/update_delta': update_delta})
+
+    async def scenario(api: InstaproAPI):
+        await api.append_analyze('an', 'followers', ['u3'])
+        return api._optional_endpoints
+
+    optional_endpoints = run(backend, scenario)
+    assert backend.analyze['data']['followers'] == ['u1', 'u2', 'u3']
+    assert '/api/analyze/update' not in backend.calls
+    assert optional_endpoints['/api/analyze/update_delta'] is True
+
+
+def test_optional_endpoints_have_separate_breakers():
+    backend = Backend()
+
+    async def unavailable(request):
+        return web.json_response({'detail': 'Service Unavailable'}, status=503)
+
+    with_routes(backend, **{'actions/get_data_many': unavailable})
+
+    async def scenario(api: InstaproAPI):
+        for _ in range(2):
+            with pytest.raises((ClientResponseError, CircuitOpenError)):
+                await api.get_data_many('act', ['a'])
+        with pytest.raises(CircuitOpenError):
+            await api.get_data_many('act', ['a'])
+        await api.append_analyze('an', 'followers', ['u3'])
+        return api._retry_policy
+
+    policy = run(backend, scenario, retry_policy=RetryPolicy(base_delay=0.001))
+    assert policy.breaker('/api/actions/get_data_many').state == 'open'
+    assert policy.breaker('/api/analyze/update_delta').state == 'closed'
+    assert backend.analyze['data']['followers'] == ['u1', 'u2', 'u3']
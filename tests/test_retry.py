@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from aiohttp import ClientConnectorError, ClientResponseError, RequestInfo, ServerDisconnectedError
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from instaproapi.retry import CircuitOpenError, RetryBudget, RetryPolicy, idempotency_key
+from instaproapi.transport import retry_async
+
+
+def response_error(status: int) -> ClientResponseError:
+    url = URL('http://backend/api/endpoint')
+    return ClientResponseError(RequestInfo(url, 'POST', CIMultiDictProxy(CIMultiDict()), url), (),
+                               status=status, message=str(status))
+
+
+class Endpoint:
+    """
+    Методы, которые первые failures вызовов падают с заданной ошибкой, а затем отвечают 'ok'
+    """
+
+    def __init__(self, error: Exception, failures: int, policy: RetryPolicy | None = None):
+        self._retry_policy = policy or RetryPolicy(base_delay=0.001)
+        self.error = error
+        self.failures = failures
+        self.calls = 0
+
+    async def _call(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return 'ok'
+
+    @retry_async(3)
+    async def read(self):
+        return await self._call()
+
+    @retry_async(3, idempotent=False)
+    async def write(self):
+        return await self._call()
+
+    @retry_async(1, breaker_exempt=frozenset({429}))
+    async def like(self):
+        return await self._call()
+
+
+def test_transient_errors_are_retried_for_idempotent_calls():
+    endpoint = Endpoint(response_error(503), failures=2)
+    assert asyncio.run(endpoint.read()) == 'ok'
+    assert endpoint.calls == 3
+
+
+def test_permanent_errors_are_not_retried():
+    endpoint = Endpoint(response_error(400), failures=1)
+    with pytest.raises(ClientResponseError):
+        asyncio.run(endpoint.read())
+    assert endpoint.calls == 1
+
+
+def test_non_idempotent_call_is_retried_only_when_not_sent():
+    endpoint = Endpoint(ServerDisconnectedError(), failures=1)
+    with pytest.raises(ServerDisconnectedError):
+        asyncio.run(endpoint.write())
+    assert endpoint.calls == 1
+
+    endpoint = Endpoint(ClientConnectorError(None, OSError(111, 'Connection refused')), failures=1)
+    assert asyncio.run(endpoint.write()) == 'ok'
+    assert endpoint.calls == 2
+
+
+def test_idempotency_key_allows_retrying_writes():
+    endpoint = Endpoint(ServerDisconnectedError(), failures=1)
+
+    async def main():
+        with idempotency_key('key'):
+            return await endpoint.write()
+
+    assert asyncio.run(main()) == 'ok'
+    assert endpoint.calls == 2
+
+
+def test_retry_budget_limits_retries():
+    policy = RetryPolicy(base_delay=0.001, budget=RetryBudget(ratio=0.1, max_tokens=1))
+    endpoint = Endpoint(response_error(503), failures=100, policy=policy)
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(ClientResponseError):
+                await endpoint.read()
+
+    asyncio.run(main())
+    # Первый вызов потратил единственный токен на повтор, следующие не повторяются
+    assert endpoint.calls == 2 + 1 + 1
+
+
+def test_breaker_opens_per_endpoint_and_recovers():
+    policy = RetryPolicy(base_delay=0.001, failure_threshold=3, reset_timeout=0.05)
+    endpoint = Endpoint(response_error(503), failures=3, policy=policy)
+
+    async def main():
+        with pytest.raises(ClientResponseError):
+            await endpoint.read()
+        with pytest.raises(CircuitOpenError):
+            await endpoint.read()
+        # Другой метод того же объекта - свой breaker
+        assert await endpoint.write() == 'ok'
+        await asyncio.sleep(0.06)
+        return await endpoint.read()
+
+    assert asyncio.run(main()) == 'ok'
+    assert policy.breaker(Endpoint.read.__qualname__).state == 'closed'
+
+
+def test_exempt_statuses_do_not_open_breaker():
+    policy = RetryPolicy(failure_threshold=2)
+    endpoint = Endpoint(response_error(429), failures=5, policy=policy)
+
+    async def main():
+        for _ in range(5):
+            with pytest.raises(ClientResponseError):
+                await endpoint.like()
+
+    asyncio.run(main())
+    assert endpoint.calls == 5
+    assert policy.breaker(Endpoint.like.__qualname__).state == 'closed'
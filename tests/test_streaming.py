@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import json
+import random
+
+import pytest
+
+from instaproapi.streaming import JsonArrayParser
+
+ITEMS = [
+    {'id': 'user_1', 'username': 'he said \\"[hi]\\"', 'tags': ['[', ']', '{', '}', '"']},
+    {'path': 'C:\\\\dir\\\\', 'nested': [[{'a': []}], {}], 'text': 'юникод \\u043f\\u0440\\u0438'},
+    'string with ] and } and \\\\',
+    1234567890,
+    -0.5e-3,
+    True,
+    None,
+    [],
+    {},
+]
+
+
+def parse(payload: bytes, sizes) -> list:
+    parser = JsonArrayParser()
+    items = []
+    position = 0
+    for size in sizes:
+        items.extend(parser.feed(payload[position:position + size]))
+        position += size
+    items.extend(parser.feed(payload[position:]))
+    parser.close()
+    return items
+
+
+def test_every_single_split_point():
+    payload = json.dumps(ITEMS).encode()
+    expected = json.loads(payload)
+    for split in range(len(payload) + 1):
+        assert parse(payload, [split]) == expected, split
+
+
+def test_byte_by_byte():
+    payload = json.dumps(ITEMS, ensure_ascii=False).encode()
+    assert parse(payload, [1] * len(payload)) == json.loads(payload)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_chunks(seed):
+    rng = random.Random(seed)
+    payload = json.dumps([ITEMS[rng.randrange(len(ITEMS))] for _ in range(200)], ensure_ascii=rng.random() < 0.5,
+                         indent=rng.choice([None, 2])).encode()
+    sizes = [rng.randint(1, 64) for _ in range(len(payload))]
+    assert parse(payload, sizes) == json.loads(payload)
+
+
+def test_number_split_across_chunks_is_not_cut():
+    parser = JsonArrayParser()
+    assert parser.feed(b'[12') == []
+    assert parser.feed(b'34, 5') == [1234]
+    assert parser.feed(b'6]') == [56]
+    parser.close()
+
+
+def test_item_is_returned_as_soon_as_it_ends():
+    parser = JsonArrayParser()
+    assert parser.feed(b'[{"a": "x\\\\') == []
+    assert parser.feed(b'"}, {"b": "]') == [{'a': 'x\\'}]
+    assert parser.feed(b'"}') == [{'b': ']'}]
+    assert parser.feed(b']') == []
+    parser.close()
+
+
+@pytest.mark.parametrize('payload', [b'[{"a": 1}, {"b": ', b'[1, 2', b'["abc', b'[{"a": 1}'])
+def test_truncated_array_raises_on_close(payload):
+    parser = JsonArrayParser()
+    parser.feed(payload)
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_malformed_item_raises():
+    parser = JsonArrayParser()
+    with pytest.raises(ValueError):
+        parser.feed(b'[{"a": 1]}')
+
+
+def test_not_an_array_raises():
+    with pytest.raises(ValueError):
+        JsonArrayParser().feed(b'{"a": 1}')
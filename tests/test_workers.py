@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import asyncio
+
+from instaproapi.schemas.action import OutAction
+from instaproapi.schemas.server_types import ActionStatuses, ActionTypes
+from instaproapi.workers import ActionWorkerPool
+
+
+class SlowStatusAPI:
+    """
+    Очередь из нескольких действий; set_status отвечает медленно, чтобы stop() пришёлся на отправку
+    """
+
+    def __init__(self, count: int, status_delay: float):
+        self.queue = [OutAction(id=str(index), action_type=ActionTypes.watch_stories, status=ActionStatuses.waiting,
+                                account_id='acc', update_id='u', result=None) for index in range(count)]
+        self.status_delay = status_delay
+        self.statuses = {}
+
+    async def get_action_queue(self, sub_server_id: str):
+        return self.queue.pop() if self.queue else None
+
+    async def set_status(self, instance_id: str, status: ActionStatuses):
+        await asyncio.sleep(self.status_delay)
+        self.statuses[instance_id] = status
+
+
+def test_stop_waits_for_statuses_being_sent():
+    api = SlowStatusAPI(3, status_delay=0.3)
+
+    async def complete(action: OutAction):
+        return ActionStatuses.completed
+
+    async def main():
+        pool = ActionWorkerPool(api, 'sub', {ActionTypes.watch_stories: complete}, status_flush_interval=0.05)
+        pool.start()
+        await asyncio.sleep(0.15)
+        await pool.stop()
+        return pool.stats
+
+    stats = asyncio.run(main())
+    assert api.statuses == dict.fromkeys(['0', '1', '2'], ActionStatuses.completed)
+    assert stats['leased'] == 0
+    assert stats['pending_statuses'] == 0